@@ -0,0 +1,194 @@
+# cache.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "2048"))
+QUERY_VECTOR_CACHE_TTL = int(os.getenv("QUERY_VECTOR_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Near-duplicate mode: reuse an answer for a differently worded question with the same retrieved chunks
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after being set.
+    Once `maxsize` entries are stored, the least recently used one is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def invalidate(self, predicate) -> int:
+        """Drop every entry whose key matches predicate(key); returns how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class SemanticAnswerCache:
+    """
+    Near-duplicate answer cache.
+
+    Answers are grouped by (chat_id, retrieved chunk IDs); a lookup returns a cached
+    answer when the new question's embedding has cosine similarity >= threshold with
+    a cached question in the same group.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float, per_group: int = 8):
+        self.threshold = threshold
+        self.per_group = per_group
+        self._groups = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, chat_id: str, chunk_ids: tuple, query_vector):
+        entries = self._groups.get((chat_id, chunk_ids)) or []
+        unit = self._unit(query_vector)
+        best_score, best_answer = -1.0, None
+        for cached_vector, answer in entries:
+            score = float(np.dot(unit, cached_vector))
+            if score > best_score:
+                best_score, best_answer = score, answer
+
+        with self._lock:
+            if best_score >= self.threshold:
+                self.hits += 1
+                return best_answer
+            self.misses += 1
+            return None
+
+    def store(self, chat_id: str, chunk_ids: tuple, query_vector, answer: str):
+        key = (chat_id, chunk_ids)
+        with self._lock:
+            entries = list(self._groups.get(key) or [])
+            entries.append((self._unit(query_vector), answer))
+            self._groups.set(key, entries[-self.per_group:])
+
+    def invalidate(self, predicate) -> int:
+        return self._groups.invalidate(predicate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                **self._groups.stats(),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and strip punctuation/extra whitespace so trivial rewordings share a cache key."""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+# normalized query -> embedding vector (independent of chat)
+query_vector_cache = TTLCache(QUERY_VECTOR_CACHE_SIZE, QUERY_VECTOR_CACHE_TTL)
+# (chat_id, normalized query, top_k) -> Qdrant hits
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+# (chat_id, sha256 of the final prompt) -> generated answer
+answer_cache = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+semantic_answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+
+
+def invalidate_chat(chat_id: str):
+    """
+    Forget everything cached about a chat's document. Call whenever its chunks change.
+    """
+    retrieval_cache.invalidate(lambda key: key[0] == chat_id)
+    answer_cache.invalidate(lambda key: key[0] == chat_id)
+    semantic_answer_cache.invalidate(lambda key: key[0] == chat_id)
+
+
+def cache_stats() -> dict:
+    return {
+        "query_vectors": query_vector_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "answers": answer_cache.stats(),
+        "semantic_answers": semantic_answer_cache.stats(),
+    }
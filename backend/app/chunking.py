@@ -0,0 +1,174 @@
+# chunking.py
+"""
+Chunkers turn a document's page stream into the Chunk records that get embedded.
+
+"token" (the default) sizes chunks by the embedding model's own tokenizer so no text
+is stored past the point where the model truncates, and cuts at paragraph, then
+sentence, then word boundaries. "words" is the original 500-word window chunker.
+Pick one with the CHUNKER environment variable.
+"""
+import os
+import re
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from app.utils import iter_chunks
+
+load_dotenv()
+
+CHUNKER = os.getenv("CHUNKER", "token")
+# 0 means the embedding model's max sequence length
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "16"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+_LINE_BREAK = re.compile(r"\n")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: Optional[int] = None        # 1-based page the chunk starts on, for paged formats
+    char_start: Optional[int] = None  # offsets into the extracted text, pages concatenated
+    char_end: Optional[int] = None
+
+    def payload(self) -> dict:
+        """Location fields stored next to the text in Qdrant."""
+        return {field: value for field, value in zip(self._fields[1:], self[1:]) if value is not None}
+
+
+class _Unit(NamedTuple):
+    text: str
+    tokens: int
+    page: int
+    start: int
+    end: int
+
+
+def _spans(text: str, separator, start: int, end: int) -> Iterator[tuple]:
+    """(start, end) of the whitespace-trimmed pieces of text[start:end] between separators."""
+    pos = start
+    for match in separator.finditer(text, start, end):
+        yield from _trimmed(text, pos, match.start())
+        pos = match.end()
+    yield from _trimmed(text, pos, end)
+
+
+def _trimmed(text: str, start: int, end: int) -> Iterator[tuple]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        yield start, end
+
+
+class TokenChunker:
+    """
+    Packs whole paragraphs into chunks of at most max_tokens model tokens. Paragraphs
+    that don't fit are split into sentences, then lines (table rows), then word runs.
+    Consecutive chunks share up to overlap_tokens worth of trailing units.
+    """
+
+    def __init__(self, count_tokens: Callable[[List[str]], List[int]], max_tokens: int, overlap_tokens: int = 0):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    def chunk(self, pages: Iterable[str], paged: bool = True) -> Iterator[Chunk]:
+        current: List[_Unit] = []
+        used = 0
+        offset = 0
+
+        for page_number, page in enumerate(pages, start=1):
+            for unit in self._units(page, page_number, offset):
+                if current and used + unit.tokens > self.max_tokens:
+                    yield self._emit(current, paged)
+                    current = self._overlap(current, self.max_tokens - unit.tokens)
+                    used = sum(u.tokens for u in current)
+                current.append(unit)
+                used += unit.tokens
+            offset += len(page)
+
+        if current:
+            yield self._emit(current, paged)
+
+    def _units(self, page: str, page_number: int, offset: int) -> Iterator[_Unit]:
+        yield from self._split(page, page_number, offset, 0, len(page), (_PARAGRAPH_BREAK, _SENTENCE_BREAK, _LINE_BREAK))
+
+    def _split(self, text, page_number, offset, start, end, separators) -> Iterator[_Unit]:
+        spans = list(_spans(text, separators[0], start, end))
+        counts = self.count_tokens([text[s:e] for s, e in spans])
+
+        for (s, e), tokens in zip(spans, counts):
+            if tokens <= self.max_tokens:
+                yield _Unit(text[s:e], tokens, page_number, offset + s, offset + e)
+            elif len(separators) > 1:
+                yield from self._split(text, page_number, offset, s, e, separators[1:])
+            else:
+                yield from self._word_runs(text, page_number, offset, s, e)
+
+    def _word_runs(self, text, page_number, offset, start, end) -> Iterator[_Unit]:
+        words = list(_spans(text, _WHITESPACE, start, end))
+        counts = self.count_tokens([text[s:e] for s, e in words])
+
+        run_start, run_end, used = None, None, 0
+        for (s, e), tokens in zip(words, counts):
+            if run_start is not None and used + tokens > self.max_tokens:
+                yield _Unit(text[run_start:run_end], used, page_number, offset + run_start, offset + run_end)
+                run_start, used = None, 0
+            if run_start is None:
+                run_start = s
+            run_end = e
+            used += tokens
+
+        if run_start is not None:
+            yield _Unit(text[run_start:run_end], used, page_number, offset + run_start, offset + run_end)
+
+    def _overlap(self, units: List[_Unit], room: int) -> List[_Unit]:
+        """Trailing units of the previous chunk to repeat at the start of the next one."""
+        budget = min(self.overlap_tokens, room)
+        kept = []
+        for unit in reversed(units):
+            if unit.tokens > budget:
+                break
+            kept.append(unit)
+            budget -= unit.tokens
+        kept.reverse()
+        return kept
+
+    @staticmethod
+    def _emit(units: List[_Unit], paged: bool) -> Chunk:
+        return Chunk(
+            text="\n".join(unit.text for unit in units),
+            page=units[0].page if paged else None,
+            char_start=units[0].start,
+            char_end=units[-1].end,
+        )
+
+
+class WordChunker:
+    """Fixed word windows, ignoring document structure and the model's token limit."""
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 50):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, pages: Iterable[str], paged: bool = True) -> Iterator[Chunk]:
+        for text in iter_chunks(pages, self.chunk_size, self.overlap):
+            yield Chunk(text)
+
+
+def get_chunker(name: str = CHUNKER):
+    if name == "token":
+        from app.embeddings import count_tokens, max_input_tokens
+
+        limit = max_input_tokens()
+        max_tokens = min(CHUNK_MAX_TOKENS, limit) if CHUNK_MAX_TOKENS > 0 else limit
+        return TokenChunker(count_tokens, max_tokens, CHUNK_OVERLAP_TOKENS)
+    elif name == "words":
+        return WordChunker()
+    else:
+        raise ValueError(f"Unknown chunker: {name}")
@@ -0,0 +1,128 @@
+# context.py
+"""
+Assemble retrieved chunks into the document context of a prompt.
+
+Chunks are written with overlapping word windows, so neighbouring hits repeat text.
+pack_context merges hits that are consecutive in the same document (dropping the shared
+overlap), drops near-duplicates, orders the result and trims it to a token budget.
+"""
+import os
+from typing import List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from app.tokens import estimate_tokens, truncate_to_tokens
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# "relevance" puts the best-scoring passage first; "position" keeps document order
+CONTEXT_ORDER = os.getenv("CONTEXT_ORDER", "relevance")
+# Word-shingle Jaccard similarity above which a passage counts as a duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Longest overlap looked for when stitching consecutive chunks together
+MAX_OVERLAP_WORDS = 200
+# A passage cut to fewer tokens than this is left out instead
+MIN_PASSAGE_TOKENS = 50
+
+SHINGLE_SIZE = 3
+
+
+class Passage(NamedTuple):
+    text: str
+    score: float          # best score of the hits merged into it
+    position: Optional[int]  # chunk_index of its first chunk, None for legacy points
+    doc_id: str = ""         # document the position belongs to
+
+
+def _strip_overlap(previous: List[str], following: List[str]) -> List[str]:
+    """Drop the leading words of `following` that repeat the tail of `previous`."""
+    for size in range(min(len(previous), len(following), MAX_OVERLAP_WORDS), 0, -1):
+        if previous[-size:] == following[:size]:
+            return following[size:]
+    return following
+
+
+def merge_adjacent(hits) -> List[Passage]:
+    """
+    Merge hits of one document whose chunk_index is consecutive into single passages.
+    chunk_index restarts with every document, so runs never cross a doc_id.
+    Points indexed before chunk_index existed are kept as they are.
+    """
+    indexed, loose, seen = [], [], set()
+    for hit in hits:
+        payload = hit.payload or {}
+        text = payload.get("text", "")
+        if not text or hit.id in seen:
+            continue  # same point returned twice
+        seen.add(hit.id)
+        index = payload.get("chunk_index")
+        if index is None:
+            loose.append((hit.score, text))
+        else:
+            # Points from before doc_id existed share the "" document
+            indexed.append((payload.get("doc_id") or "", index, hit.score, text))
+
+    passages = [Passage(text, score, None) for score, text in loose]
+
+    run_words, run_score, run_start, run_end, run_doc = None, 0.0, None, None, None
+    for doc_id, index, score, text in sorted(indexed, key=lambda h: h[:2]):
+        words = text.split()
+        if run_words is not None and doc_id == run_doc and index == run_end + 1:
+            run_words.extend(_strip_overlap(run_words, words))
+            run_score = max(run_score, score)
+            run_end = index
+            continue
+        if run_words is not None:
+            passages.append(Passage(" ".join(run_words), run_score, run_start, run_doc))
+        run_words, run_score, run_start, run_end, run_doc = words, score, index, index, doc_id
+
+    if run_words is not None:
+        passages.append(Passage(" ".join(run_words), run_score, run_start, run_doc))
+
+    return passages
+
+
+def _shingles(text: str) -> set:
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(passages: List[Passage], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Passage]:
+    """Keep the best-scoring passage of every group of near-identical ones."""
+    kept, kept_shingles = [], []
+    for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+        shingles = _shingles(passage.text)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_context(hits, budget: int = CONTEXT_TOKEN_BUDGET, order: str = CONTEXT_ORDER) -> str:
+    """
+    Document context for the prompt built from Qdrant hits: merged, deduplicated,
+    ordered and cut to at most `budget` tokens.
+    """
+    passages = drop_near_duplicates(merge_adjacent(hits))  # best score first
+
+    # Spend the budget on the most relevant passages whatever the final order
+    selected, used = [], 0
+    for passage in passages:
+        remaining = budget - used
+        cost = estimate_tokens(passage.text)
+        if cost > remaining:
+            if remaining >= MIN_PASSAGE_TOKENS:
+                selected.append(passage._replace(text=truncate_to_tokens(passage.text, remaining)))
+            break
+        selected.append(passage)
+        used += cost
+
+    if order == "position":
+        # Document by document; legacy points without a position go last, by relevance
+        selected.sort(key=lambda p: (p.position is None, p.doc_id, p.position or 0))
+
+    return "\n\n".join(passage.text for passage in selected)
@@ -0,0 +1,143 @@
+# embedding_batcher.py
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.embeddings import embed_texts
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How long the first request of a batch waits for company, and the largest batch we build
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+
+class QueryEmbeddingBatcher:
+    """
+    Dynamic micro-batcher for query embeddings.
+
+    Requests that arrive within max_wait_ms of the first waiting request (up to
+    max_batch_size of them) are encoded in a single forward pass on a background
+    thread, and each caller gets its own row back through a Future.
+    """
+
+    def __init__(self, max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS, max_batch_size: int = QUERY_BATCH_MAX_SIZE):
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._batches = 0
+        self._requests = 0
+        self._max_batch_seen = 0
+        self._batch_size_histogram = {}
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_encode = 0.0
+
+    def submit(self, text: str) -> Future:
+        """Queue a query for embedding and return a Future resolving to its vector."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> np.ndarray:
+        """Await a query embedding without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get()]
+                deadline = time.perf_counter() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                self._encode_batch(batch)
+            except Exception:
+                # Every query embedding goes through this thread; it must outlive any one batch
+                logger.exception("Query embedding batcher failed to process a batch")
+
+    def _encode_batch(self, batch):
+        # Callers that gave up (timeouts, disconnects) cancelled their futures; skip them
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        texts = [text for text, _, _ in batch]
+
+        try:
+            vectors = embed_texts(texts)
+        except Exception as e:
+            logger.error(f"Query embedding batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        for row, (_, future, _) in enumerate(batch):
+            if not future.done():
+                future.set_result(vectors[row])
+
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._batch_size_histogram[len(batch)] = self._batch_size_histogram.get(len(batch), 0) + 1
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._total_encode += finished - started
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch_size": self.max_batch_size,
+                "pending": self._queue.qsize(),
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": round(self._requests / batches, 2),
+                "max_batch_size_seen": self._max_batch_seen,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items())),
+                "avg_wait_ms": round(self._total_wait / requests * 1000, 3),
+                "max_wait_ms_seen": round(self._max_wait_seen * 1000, 3),
+                "avg_encode_ms": round(self._total_encode / batches * 1000, 3),
+            }
+
+
+query_batcher = QueryEmbeddingBatcher()
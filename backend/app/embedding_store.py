@@ -0,0 +1,215 @@
+# embedding_store.py
+"""
+On-disk, content-addressed cache of chunk embeddings.
+
+The same handbooks and contracts get uploaded into many chats; their chunks hash to the
+same keys, so only text the model has never seen is encoded. Vectors live in a
+memory-mapped float32 matrix next to a matrix of sha256 keys and a last-used clock per
+slot. The key index is rebuilt from those files at startup, and the least recently used
+slot is reused once the store reaches EMBED_CACHE_MAX_MB.
+
+Several processes may share the files (uvicorn/gunicorn workers, the process ingestion
+executor). Each configuration gets its own subdirectory, so a process never truncates
+files another one has mapped. Reads and writes take a file lock. Each process keeps
+its own index, so a slot another process reused is detected by re-checking its key and
+treated as a miss.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.embeddings import EMBEDDING_MODEL_NAME, EMBEDDING_DIM, NORMALIZE_EMBEDDINGS, embed_texts
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, fine for a single dev server
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".embedding_cache")
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "256"))
+
+KEY_BYTES = 32
+
+
+def content_key(text: str) -> bytes:
+    """Cache key of a chunk: its text plus everything that changes the vector it embeds to."""
+    namespace = f"{EMBEDDING_MODEL_NAME}\0{NORMALIZE_EMBEDDINGS}\0"
+    return hashlib.sha256((namespace + text).encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, capacity: int, dim: int):
+        self.capacity = capacity
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        meta = {"model": EMBEDDING_MODEL_NAME, "normalize": NORMALIZE_EMBEDDINGS, "dim": dim, "capacity": capacity}
+        config_id = hashlib.sha256(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(directory, config_id)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "lock"), "a+")
+
+        with self._file_lock(exclusive=True):
+            meta_path = os.path.join(self.directory, "meta.json")
+            try:
+                with open(meta_path) as f:
+                    reuse = json.load(f) == meta
+            except (OSError, ValueError):
+                reuse = False
+
+            # Only a directory that was never completed is (re)created
+            mode = "r+" if reuse else "w+"
+            self._vectors = self._map("vectors.f32", np.float32, mode, (capacity, dim))
+            self._keys = self._map("keys.bin", np.uint8, mode, (capacity, KEY_BYTES))
+            self._last_used = self._map("last_used.u64", np.uint64, mode, (capacity,))
+            if not reuse:
+                self._vectors.flush()
+                self._keys.flush()
+                self._last_used.flush()
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+
+            # Slot 0 of last_used means empty; everything else is ordered oldest first
+            used = np.flatnonzero(self._last_used)
+            used = used[np.argsort(self._last_used[used], kind="stable")]
+            self._slots = OrderedDict((self._keys[slot].tobytes(), int(slot)) for slot in used)
+            self._free = sorted(set(range(capacity)) - set(self._slots.values()), reverse=True)
+            self._clock = int(self._last_used.max()) if capacity else 0
+
+        logger.info(f"Embedding store at {self.directory}: {len(self._slots)}/{capacity} vectors")
+
+    def _map(self, name, dtype, mode, shape):
+        return np.memmap(os.path.join(self.directory, name), dtype, mode, shape=shape)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def fill(self, keys: List[bytes], out: np.ndarray) -> List[int]:
+        """Copy cached vectors into the matching rows of `out`; return the rows still missing."""
+        missing = []
+        with self._lock, self._file_lock(exclusive=False):
+            for row, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is not None and self._keys[slot].tobytes() != key:
+                    # Another process has reused the slot since this index was built
+                    del self._slots[key]
+                    slot = None
+                if slot is None:
+                    missing.append(row)
+                    continue
+                out[row] = self._vectors[slot]
+                self._touch(key, slot)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return missing
+
+    def put(self, keys: List[bytes], vectors: np.ndarray):
+        with self._lock, self._file_lock(exclusive=True):
+            for key, vector in zip(keys, vectors):
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._take_slot()
+                # Unmark the slot while it is rewritten so a crash can't pair a key with the wrong vector
+                self._last_used[slot] = 0
+                self._keys[slot] = 0
+                self._vectors[slot] = vector
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._touch(key, slot)
+
+    def _take_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        _, slot = self._slots.popitem(last=False)
+        self.evictions += 1
+        return slot
+
+    def _touch(self, key: bytes, slot: int):
+        self._clock += 1
+        self._last_used[slot] = self._clock
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+
+    def flush(self):
+        with self._lock:
+            self._vectors.flush()
+            self._keys.flush()
+            self._last_used.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store():
+    """The process-wide store, opened on first use; None when disabled or unusable."""
+    global _store, EMBED_CACHE_ENABLED
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            capacity = EMBED_CACHE_MAX_MB * 1024 * 1024 // (EMBEDDING_DIM * 4 + KEY_BYTES + 8)
+            try:
+                _store = EmbeddingStore(EMBED_CACHE_DIR, capacity, EMBEDDING_DIM)
+            except Exception as e:
+                logger.error(f"Embedding store unavailable, embedding every chunk: {e}")
+                EMBED_CACHE_ENABLED = False
+                return None
+        return _store
+
+
+def embed_texts_cached(texts: List[str]) -> np.ndarray:
+    """embed_texts, but chunks seen before are read from the embedding store."""
+    store = get_embedding_store()
+    if store is None:
+        return embed_texts(texts)
+
+    keys = [content_key(text) for text in texts]
+    vectors = np.empty((len(texts), store.dim), dtype=np.float32)
+    missing = store.fill(keys, vectors)
+
+    if missing:
+        fresh = embed_texts([texts[row] for row in missing])
+        vectors[missing] = fresh
+        store.put([keys[row] for row in missing], fresh)
+
+    return vectors
+
+
+def embedding_store_stats() -> dict:
+    return _store.stats() if _store is not None else {"enabled": EMBED_CACHE_ENABLED}
@@ -1,4 +1,115 @@
-from sentence_transformers import SentenceTransformer
+from typing import List
+import copy
+import logging
+import os
+import threading
+import time
 
-# Using HuggingFace model for embeddings
-model = SentenceTransformer("paraphrase-MiniLM-L3-v2", device="cpu")
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-MiniLM-L3-v2")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))  # Must match the model output
+# Texts per forward pass; bounds the activation memory of a single encode call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Unit-length vectors let Qdrant score with a plain dot product instead of cosine
+NORMALIZE_EMBEDDINGS = os.getenv("NORMALIZE_EMBEDDINGS", "false").lower() == "true"
+# A failed warm-up is retried after this many seconds, doubling up to the maximum
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", "5"))
+WARM_UP_MAX_RETRY_SECONDS = float(os.getenv("WARM_UP_MAX_RETRY_SECONDS", "300"))
+
+# Using HuggingFace model for embeddings. sentence-transformers (and torch) are imported
+# and the model is loaded on first use, or ahead of time by warm_up() at startup.
+_model = None
+_model_lock = threading.Lock()
+_model_state = {"status": "not_loaded", "error": None, "load_seconds": None}
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model_state["status"] = "loading"
+                started = time.perf_counter()
+                try:
+                    from sentence_transformers import SentenceTransformer
+
+                    _model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+                except Exception as e:
+                    _model_state.update(status="failed", error=str(e))
+                    raise
+                # Not "ready" yet: warm_up() marks that once an encode has gone through
+                _model_state.update(status="loaded", error=None, load_seconds=round(time.perf_counter() - started, 3))
+    return _model
+
+
+def warm_up(retry_seconds: float = WARM_UP_RETRY_SECONDS, max_retry_seconds: float = WARM_UP_MAX_RETRY_SECONDS):
+    """
+    Load the model and run one encode so the first real request pays for neither.
+    Failures (a download hiccup, say) are retried with backoff until the model is ready,
+    since the routes that would otherwise load it are the ones gated on it.
+    """
+    delay = retry_seconds
+    while True:
+        try:
+            started = time.perf_counter()
+            get_model().encode(["warm up"], show_progress_bar=False)
+            _model_state.update(status="ready", error=None)
+            logger.info(f"Embedding model {EMBEDDING_MODEL_NAME} ready in {time.perf_counter() - started:.2f}s")
+            return
+        except Exception as e:
+            _model_state.update(status="failed", error=str(e))
+            logger.error(f"Embedding model warm-up failed, retrying in {delay:g}s: {e}")
+        time.sleep(delay)
+        delay = min(delay * 2, max_retry_seconds)
+
+
+def model_ready() -> bool:
+    return _model_state["status"] == "ready"
+
+
+def model_status() -> dict:
+    return {"model": EMBEDDING_MODEL_NAME, **_model_state}
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Encode texts into a float32 (len(texts), EMBEDDING_DIM) matrix,
+    EMBED_BATCH_SIZE texts per forward pass.
+    """
+    vectors = get_model().encode(
+        texts,
+        batch_size=EMBED_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=NORMALIZE_EMBEDDINGS,
+        show_progress_bar=False,
+    )
+    return vectors.astype(np.float32, copy=False)
+
+
+# Chunking counts tokens from ingestion threads while queries are being encoded;
+# a Rust tokenizer must not be used concurrently, so chunking gets its own copy.
+_chunk_tokenizer = None
+_chunk_tokenizer_lock = threading.Lock()
+
+
+def max_input_tokens() -> int:
+    """Tokens of a text the model actually embeds; anything past this is truncated."""
+    return get_model().max_seq_length - 2  # [CLS] and [SEP]
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """Model token counts of each text, without special tokens."""
+    global _chunk_tokenizer
+    if not texts:
+        return []
+    with _chunk_tokenizer_lock:
+        if _chunk_tokenizer is None:
+            _chunk_tokenizer = copy.deepcopy(get_model().tokenizer)
+        encoded = _chunk_tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+    return [len(ids) for ids in encoded]
@@ -0,0 +1,184 @@
+# history.py
+"""
+Token-budgeted conversation history with a rolling summary.
+
+The prompt gets the most recent turns that fit in HISTORY_TOKEN_BUDGET. Turns that
+fall out of that window are folded into a per-chat summary stored on the chats row
+(`history_summary`, plus `history_summary_until`, the created_at of the newest
+message it covers). The summary is updated incrementally in the background, so
+prompt size stays bounded however long the chat runs.
+
+The two columns are added by migrations/20261018000000_chats_history_summary.sql.
+Until that has run, summaries are skipped and only the recent window is sent.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from app.supabase_client import get_async_supabase
+from app.llm import get_llm, is_error_response
+from app.tokens import estimate_tokens, truncate_to_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Most recent messages considered for the verbatim window
+HISTORY_FETCH_LIMIT = int(os.getenv("HISTORY_FETCH_LIMIT", "40"))
+# Wait until this many turns have left the window before re-summarizing
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "6"))
+# Upper bound on turns folded into the summary per update
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", "60"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "400"))
+# After the summary columns fail to read (e.g. the migration isn't applied), wait this long before trying again
+SUMMARY_RETRY_SECONDS = 600
+
+# Until this monotonic time, summaries are neither read nor generated
+_summary_unavailable_until = 0.0
+
+# Chats with a summary update in flight, and strong refs to the tasks doing them
+_summarizing = set()
+_summary_tasks = set()
+
+
+def _format_turns(messages) -> str:
+    return "".join(f"{msg['role']}: {msg['content']}\n" for msg in messages)
+
+
+def select_window(messages_newest_first, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Split messages (newest first) into the verbatim window that fits the token budget
+    (returned oldest first) and the older remainder.
+    """
+    window = []
+    used = 0
+    for msg in messages_newest_first:
+        cost = estimate_tokens(msg["content"]) + 2
+        if used + cost > budget:
+            if not window:
+                # Always keep the latest turn, cut down to fit
+                window.append({**msg, "content": truncate_to_tokens(msg["content"], budget)})
+            break
+        window.append(msg)
+        used += cost
+
+    overflow = messages_newest_first[len(window):]
+    window.reverse()
+    return window, overflow
+
+
+async def build_history_context(chat_id: str) -> str:
+    """
+    Conversation context for the prompt: the rolling summary of older turns (if any)
+    followed by the most recent turns that fit the token budget.
+    """
+    global _summary_unavailable_until
+    supabase = await get_async_supabase()
+    summaries_enabled = time.monotonic() >= _summary_unavailable_until
+
+    queries = [
+        supabase.table("messages")
+            .select("id, role, content, created_at")
+            .eq("chat_id", chat_id)
+            .order("created_at", desc=True)
+            .limit(HISTORY_FETCH_LIMIT)
+            .execute(),
+    ]
+    if summaries_enabled:
+        queries.append(
+            supabase.table("chats")
+                .select("history_summary, history_summary_until")
+                .eq("id", chat_id)
+                .execute()
+        )
+    messages_res, *summary_results = await asyncio.gather(*queries, return_exceptions=True)
+
+    if isinstance(messages_res, BaseException):
+        raise messages_res
+
+    summary, summary_until = None, None
+    summary_res = summary_results[0] if summary_results else None
+    if isinstance(summary_res, BaseException):
+        # Without the columns a summary could be generated but never stored; don't pay for it
+        logger.warning(
+            f"History summaries disabled for {SUMMARY_RETRY_SECONDS}s, chats summary columns unreadable: {summary_res}"
+        )
+        _summary_unavailable_until = time.monotonic() + SUMMARY_RETRY_SECONDS
+        summaries_enabled = False
+    elif summary_res is not None and summary_res.data:
+        summary = summary_res.data[0].get("history_summary")
+        summary_until = summary_res.data[0].get("history_summary_until")
+
+    messages = messages_res.data or []
+    window, overflow = select_window(messages)
+
+    # Turns that left the window but are not summarized yet
+    unsummarized = [msg for msg in overflow if summary_until is None or msg["created_at"] > summary_until]
+    if summaries_enabled and window and len(unsummarized) >= SUMMARY_MIN_NEW_MESSAGES:
+        schedule_summary_update(chat_id, summary, summary_until, window[0]["created_at"])
+
+    context = ""
+    if summary:
+        context += f"Summary of earlier conversation:\n{summary}\n\n"
+    context += _format_turns(window)
+    return context
+
+
+def schedule_summary_update(chat_id: str, summary, summary_until, window_start: str):
+    """
+    Fold turns older than window_start into the chat's summary in the background,
+    unless an update for this chat is already running.
+    """
+    if chat_id in _summarizing:
+        return
+    _summarizing.add(chat_id)
+
+    task = asyncio.create_task(_update_summary(chat_id, summary, summary_until, window_start))
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+async def _update_summary(chat_id: str, summary, summary_until, window_start: str):
+    try:
+        supabase = await get_async_supabase()
+
+        query = supabase.table("messages")\
+            .select("role, content, created_at")\
+            .eq("chat_id", chat_id)\
+            .lt("created_at", window_start)
+        if summary_until:
+            query = query.gt("created_at", summary_until)
+        res = await query.order("created_at").limit(SUMMARY_MAX_MESSAGES).execute()
+
+        turns = res.data or []
+        if not turns:
+            return
+
+        prompt = (
+            "You maintain a running summary of a conversation between a user and an assistant "
+            "about an uploaded document. Update the summary with the new turns below. Keep facts, "
+            "names, numbers and open questions the user may refer back to; drop pleasantries.\n"
+            f"Keep it under {SUMMARY_TOKEN_BUDGET * 3 // 4} words.\n\n"
+            f"Current summary:\n{summary or '(none yet)'}\n\n"
+            f"New turns:\n{_format_turns(turns)}\n"
+            "Updated summary:"
+        )
+        new_summary = await get_llm().agenerate(prompt)
+        if is_error_response(new_summary):
+            logger.warning(f"History summary update failed for chat {chat_id}: {new_summary}")
+            return
+
+        await supabase.table("chats").update({
+            "history_summary": truncate_to_tokens(new_summary, SUMMARY_TOKEN_BUDGET),
+            "history_summary_until": turns[-1]["created_at"],
+        }).eq("id", chat_id).execute()
+        logger.info(f"Folded {len(turns)} turns into the history summary of chat {chat_id}")
+
+    except Exception as e:
+        logger.error(f"History summary update failed for chat {chat_id}: {e}")
+    finally:
+        _summarizing.discard(chat_id)
@@ -0,0 +1,466 @@
+# ingestion.py
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from qdrant_client import models
+
+from app.qdrant_client import qdrant, COLLECTION_NAME, ensure_schema, mark_schema_stale
+from app.supabase_client import supabase
+from app.embedding_store import embed_texts_cached, get_embedding_store
+from app.utils import batched, iter_file_pages, upload_to_supabase_storage, extract_filename_from_url
+from app.chunking import get_chunker
+from app.jobs import job_store
+from app.cache import invalidate_chat
+from app.uploads import UploadBuffer
+from app.vector_writer import QdrantBulkWriter, UPSERT_MAX_RETRIES
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "thread" keeps one copy of the embedding model; "process" sidesteps the GIL but
+# loads the model once per worker process.
+INGESTION_EXECUTOR = os.getenv("INGESTION_EXECUTOR", "thread")
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "8"))
+# Chunks embedded and upserted together; bounds peak memory per document
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Re-uploading to a chat replaces its document, embedding only chunks it didn't have yet.
+# "false" keeps adding points next to the existing ones.
+INCREMENTAL_REINDEX = os.getenv("INCREMENTAL_REINDEX", "true").lower() == "true"
+# Point IDs are derived from the chat and the chunk text, so re-uploads map to the same points
+POINT_ID_NAMESPACE = uuid.UUID("6f2b9c1e-4d0a-5b8e-9a37-2c51d8e0f4a6")
+# Payload fields that can move when the text around an unchanged chunk is edited.
+# doc_id scopes chunk_index: retrieval only stitches neighbours of the same document.
+POSITION_FIELDS = ["doc_id", "chunk_index", "page", "char_start", "char_end"]
+
+
+class IngestionQueueFull(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+
+class IngestionError(Exception):
+    """A pipeline failure that should be reported to the client with the given status."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IngestionPool:
+    """
+    Bounded worker pool for document ingestion.
+
+    At most `workers` documents are processed at once and at most `queue_size`
+    more wait for a free worker. Anything beyond that is rejected with
+    IngestionQueueFull so callers can apply backpressure instead of queueing forever.
+    """
+
+    def __init__(self, workers: int, queue_size: int, executor: str = "thread"):
+        if executor == "process":
+            # Workers start lazily, after the batcher and writer threads exist; forking then is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        elif executor == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        else:
+            raise ValueError(f"Unknown ingestion executor: {executor}")
+
+        self.executor_kind = executor
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn on the pool and return a concurrent.futures.Future.
+        Raises IngestionQueueFull when there is no free slot.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise IngestionQueueFull(
+                f"Ingestion queue is full ({self.workers} running, {self.queue_size} waiting)"
+            )
+
+        with self._lock:
+            self._in_flight += 1
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(failed=True)
+            raise
+
+        future.add_done_callback(lambda f: self._release(failed=f.cancelled() or f.exception() is not None))
+        return future
+
+    def _release(self, failed: bool):
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "executor": self.executor_kind,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": min(in_flight, self.workers),
+                "queue_depth": max(0, in_flight - self.workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+ingestion_pool = IngestionPool(INGESTION_WORKERS, INGESTION_QUEUE_SIZE, INGESTION_EXECUTOR)
+
+
+def _no_progress(stage: str, **fields):
+    pass
+
+
+def chunk_point_id(chat_id: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{chat_id}:{digest}"))
+
+
+def _existing_points(chat_id: str) -> dict:
+    """Position payload of every point already stored for chat_id, by point ID."""
+    points = {}
+    offset = None
+    while True:
+        records, offset = qdrant.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=models.Filter(
+                must=[models.FieldCondition(key="chat_id", match=models.MatchValue(value=chat_id))]
+            ),
+            limit=1000,
+            offset=offset,
+            with_payload=POSITION_FIELDS,
+            with_vectors=False,
+        )
+        for record in records:
+            points[str(record.id)] = record.payload or {}
+        if offset is None:
+            return points
+
+
+def _document_id(existing: dict) -> str:
+    """
+    doc_id for the new upload. A re-indexed version keeps its document's id, so kept
+    chunks don't all need rewriting; an appended document gets a fresh one.
+    """
+    for payload in existing.values():
+        if payload.get("doc_id"):
+            return payload["doc_id"]
+    return uuid.uuid4().hex
+
+
+def _update_positions(updates: dict):
+    """Rewrite the position fields of points that were kept but moved within the document."""
+    qdrant.batch_update_points(
+        collection_name=COLLECTION_NAME,
+        update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in updates.items()
+        ],
+    )
+
+
+def _delete_points(chat_id: str, ids, reason: str):
+    """
+    Best-effort removal of the given points of chat_id
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    try:
+        for id_batch in batched(ids, 1000):
+            qdrant.delete(
+                collection_name=COLLECTION_NAME,
+                points_selector=models.PointIdsList(points=id_batch),
+            )
+        logger.info(f"✅ Deleted {len(ids)} Qdrant vectors of chat_id {chat_id} ({reason})")
+        invalidate_chat(chat_id)
+
+    except Exception as cleanup_error:
+        logger.error(f"❌ Failed to delete Qdrant vectors ({reason}): {cleanup_error}")
+        # Log this for manual cleanup later
+        logger.critical(f"MANUAL CLEANUP NEEDED: {len(ids)} orphaned vectors in Qdrant for chat_id: {chat_id}")
+
+
+def _previous_file_url(chat_id: str):
+    try:
+        res = supabase.table("chats").select("file_url").eq("id", chat_id).execute()
+        return res.data[0].get("file_url") if res.data else None
+    except Exception as e:
+        logger.warning(f"Could not look up the current file of chat {chat_id}: {e}")
+        return None
+
+
+def _delete_stored_file(file_url: str):
+    filename = extract_filename_from_url(file_url)
+    if not filename:
+        return
+    try:
+        supabase.storage.from_("documents").remove([filename])
+        logger.info(f"Deleted replaced file {filename} from storage")
+    except Exception as e:
+        logger.warning(f"Could not delete replaced file {filename}: {e}")
+
+
+def _upload_failed() -> IngestionError:
+    mark_schema_stale()
+    return IngestionError(
+        500,
+        f"Vector DB upload failed after {UPSERT_MAX_RETRIES} attempts. File not uploaded to prevent orphaned storage."
+    )
+
+
+def ingest_document(chat_id: str, filename: str, content_type: str, upload: UploadBuffer, progress=None):
+    """
+    Parse, chunk, embed and index one uploaded document, then store the original
+    file and attach it to the chat. Runs on an ingestion worker, never on the event loop.
+
+    Pages are streamed through the chunker and embedded/upserted INGEST_BATCH_SIZE
+    chunks at a time, so memory stays bounded by the batch rather than the document.
+
+    With INCREMENTAL_REINDEX, a new version of the chat's document only embeds chunks
+    whose text is new; chunks that disappeared and the previous file are removed once
+    the new version is stored.
+
+    The parser and the storage uploader both read the spooled upload directly.
+    `progress(stage, **fields)` is called as the pipeline moves between stages.
+    Returns (chunk_count, file_url).
+    """
+    progress = progress or _no_progress
+
+    # ✅ STEP 1: Open the document as a page stream (PDF, TXT, CSV or XLSX)
+    progress("parsing")
+    fileobj = upload.open()
+    try:
+        pages = iter_file_pages(filename, fileobj)
+    except ValueError as ve:
+        fileobj.close()
+        logger.error(f"Unsupported file type: {ve}")
+        raise IngestionError(400, str(ve))
+    except Exception as e:
+        fileobj.close()
+        logger.error(f"Error reading file: {e}")
+        raise IngestionError(500, f"Error reading file: {e}")
+
+    # The schema is set up at startup; this only does work again after a Qdrant error
+    try:
+        ensure_schema()
+        existing = _existing_points(chat_id) if INCREMENTAL_REINDEX else {}
+    except Exception as e:
+        fileobj.close()
+        mark_schema_stale()
+        logger.error(f"Qdrant setup error: {e}")
+        raise IngestionError(500, "Qdrant setup failed.")
+
+    previous_file_url = _previous_file_url(chat_id) if existing else None
+    doc_id = _document_id(existing)
+
+    # ✅ STEP 2: Chunk -> embed -> upsert, one batch at a time (MUST succeed before Supabase upload)
+    progress("embedding")
+    # Page numbers only mean something for PDFs; other formats stream lines or tables
+    paged = filename.lower().endswith(".pdf")
+    chunk_count = 0
+    reused = 0     # chunks already indexed from the previous version
+    seen = set()   # point IDs of the new version
+    added = []     # point IDs this upload created, removed again if it fails
+    # Uploads run behind the loop, so batch N+1 is embedded while batch N is sent
+    writer = QdrantBulkWriter()
+
+    try:
+        try:
+            # The token chunker loads the embedding model's tokenizer
+            chunk_batches = batched(get_chunker().chunk(pages, paged), INGEST_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Chunker setup failed: {e}")
+            raise IngestionError(500, f"Chunker setup failed: {e}")
+
+        while True:
+            try:
+                chunks = next(chunk_batches, None)
+            except Exception as e:
+                logger.error(f"Error reading file: {e}")
+                raise IngestionError(500, f"Error reading file: {e}")
+
+            if chunks is None:
+                break
+
+            new_ids, new_texts, new_payloads, moved = [], [], {}, {}
+            for i, chunk in enumerate(chunks):
+                point_id = chunk_point_id(chat_id, chunk.text)
+                if point_id in seen:
+                    continue  # repeated text within the document is indexed once
+                seen.add(point_id)
+
+                # chunk_index lets retrieval stitch neighbouring chunks back together
+                position = {"doc_id": doc_id, "chunk_index": chunk_count + i, **chunk.payload()}
+                if point_id in existing:
+                    reused += 1
+                    if any(existing[point_id].get(field) != position.get(field) for field in POSITION_FIELDS):
+                        moved[point_id] = position
+                    continue
+
+                new_ids.append(point_id)
+                new_texts.append(chunk.text)
+                new_payloads[point_id] = {"text": chunk.text, "chat_id": chat_id, **position}
+
+            if new_ids:
+                try:
+                    vectors = embed_texts_cached(new_texts)
+                except Exception as e:
+                    logger.error(f"Embedding generation failed: {e}")
+                    raise IngestionError(500, "Embedding failed.")
+
+                added.extend(new_ids)
+                try:
+                    writer.write(new_ids, vectors, [new_payloads[point_id] for point_id in new_ids])
+                except Exception:
+                    raise _upload_failed()
+
+            if moved:
+                try:
+                    _update_positions(moved)
+                except Exception as e:
+                    # Stale positions only affect how neighbouring hits are merged
+                    logger.warning(f"Could not update positions of {len(moved)} kept chunks: {e}")
+
+            chunk_count += len(chunks)
+            progress("embedding", chunks_embedded=len(added), chunks_reused=reused)
+
+        try:
+            writer.close()
+        except Exception:
+            raise _upload_failed()
+
+    except IngestionError:
+        writer.abort()
+        # Earlier batches may already be indexed; don't leave a half-indexed document behind.
+        # Points the previous version already had stay, so that version remains searchable.
+        _delete_points(chat_id, added, "failed ingestion")
+        raise
+    finally:
+        fileobj.close()
+
+    if chunk_count == 0:
+        logger.warning("Uploaded file has no readable content.")
+        raise IngestionError(400, "Empty or unreadable file.")
+
+    logger.info(f"✅ Successfully indexed {chunk_count} chunks in Qdrant ({len(added)} embedded, {reused} reused)")
+    if get_embedding_store() is not None:
+        get_embedding_store().flush()
+    invalidate_chat(chat_id)
+    progress("embedding", chunks_total=chunk_count)
+
+    # ✅ STEP 3: Upload to Supabase ONLY after Qdrant success
+    logger.info("Qdrant upload successful, proceeding with Supabase upload...")
+    progress("storing")
+
+    try:
+        with upload.storage_body() as body:
+            file_url = upload_to_supabase_storage(body, filename, content_type, chat_id)
+        logger.info(f"Successfully uploaded file to Supabase: {file_url}")
+    except Exception as e:
+        logger.error(f"Supabase upload failed: {e}")
+
+        # ✅ CLEANUP: Remove Qdrant vectors since Supabase upload failed
+        logger.info("Attempting to clean up Qdrant vectors due to Supabase failure...")
+        _delete_points(chat_id, added, "storage upload failed")
+
+        raise IngestionError(500, "File storage upload failed. Vector data has been cleaned up.")
+
+    # ✅ STEP 4: Update chat metadata ONLY after both uploads succeed
+    progress("finalizing", file_url=file_url)
+    try:
+        supabase.table("chats").update({
+            "file_url": file_url,
+            "file_name": filename
+        }).eq("id", chat_id).execute()
+        logger.info(f"Chat {chat_id} updated with file_url and file_name.")
+    except Exception as e:
+        logger.error(f"Chat update failed: {e}")
+        # Both uploads succeeded but metadata update failed
+        logger.warning("File uploads succeeded but chat metadata update failed")
+        raise IngestionError(500, "Error updating chat metadata.")
+
+    # ✅ STEP 5: The new version is live; drop what only the previous one had
+    _delete_points(chat_id, existing.keys() - seen, "removed from document")
+    if previous_file_url and previous_file_url != file_url:
+        _delete_stored_file(previous_file_url)
+
+    return chunk_count, file_url
+
+
+def finish_ingestion(chat_id: str, upload: UploadBuffer):
+    """
+    Run in the serving process once an ingestion future is done, whatever its outcome.
+    With the process executor, the worker's own invalidate_chat only clears the worker's caches.
+    """
+    upload.close()
+    invalidate_chat(chat_id)
+
+
+def start_ingestion_job(chat_id: str, user_id: str, filename: str, content_type: str, upload: UploadBuffer) -> dict:
+    """
+    Queue ingest_document as a background job and return its job record right away.
+
+    The work is owned by the ingestion pool, not by the request, so it keeps running
+    if the client disconnects. Raises IngestionQueueFull when the pool is saturated.
+    """
+    job = job_store.create(chat_id, user_id, filename)
+    job_id = job["job_id"]
+
+    # Worker processes cannot report back into this process' job store, so process
+    # pools only surface the queued -> completed/failed transitions.
+    progress = None if ingestion_pool.executor_kind == "process" else partial(job_store.update, job_id)
+
+    try:
+        future = ingestion_pool.submit(ingest_document, chat_id, filename, content_type, upload, progress)
+    except IngestionQueueFull:
+        job_store.remove(job_id)
+        raise
+
+    def _on_done(f):
+        finish_ingestion(chat_id, upload)
+        try:
+            chunk_count, file_url = f.result()
+        except IngestionError as e:
+            job_store.update(job_id, "failed", error=e.detail)
+        except Exception as e:
+            logger.exception(f"Ingestion job {job_id} crashed")
+            job_store.update(job_id, "failed", error=str(e))
+        else:
+            job_store.update(job_id, "completed", chunks_total=chunk_count, file_url=file_url)
+            logger.info(f"Ingestion job {job_id} completed with {chunk_count} chunks")
+
+    future.add_done_callback(_on_done)
+    return job
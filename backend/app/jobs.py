@@ -0,0 +1,89 @@
+# jobs.py
+import os
+import threading
+from datetime import datetime
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+MAX_TRACKED_JOBS = int(os.getenv("MAX_TRACKED_JOBS", "1000"))
+
+FINISHED_STAGES = ("completed", "failed")
+
+
+class JobStore:
+    """
+    In-process store for background ingestion jobs.
+
+    Jobs live only as long as this worker process; finished jobs are dropped after
+    JOB_RETENTION_SECONDS, and the oldest finished jobs go first once MAX_TRACKED_JOBS is reached.
+    """
+
+    def __init__(self, retention_seconds: int = JOB_RETENTION_SECONDS, max_jobs: int = MAX_TRACKED_JOBS):
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, chat_id: str, user_id: str, file_name: str) -> dict:
+        now = datetime.utcnow()
+        job = {
+            "job_id": str(uuid4()),
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "file_name": file_name,
+            "stage": "queued",
+            "chunks_total": None,
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "file_url": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._prune(now)
+            self._jobs[job["job_id"]] = job
+        return dict(job)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, stage: str = None, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if stage is not None:
+                job["stage"] = stage
+            job.update(fields)
+            job["updated_at"] = datetime.utcnow()
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self, now: datetime):
+        finished = [
+            job for job in self._jobs.values() if job["stage"] in FINISHED_STAGES
+        ]
+        for job in finished:
+            if (now - job["updated_at"]).total_seconds() > self.retention_seconds:
+                del self._jobs[job["job_id"]]
+
+        overflow = len(self._jobs) - self.max_jobs + 1
+        if overflow > 0:
+            finished = sorted(
+                (job for job in self._jobs.values() if job["stage"] in FINISHED_STAGES),
+                key=lambda job: job["updated_at"],
+            )
+            for job in finished[:overflow]:
+                del self._jobs[job["job_id"]]
+
+
+job_store = JobStore()
@@ -0,0 +1,178 @@
+# llm.py
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "gemini" for the real model, "fake" for the deterministic stand-in used in tests and local dev
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+
+
+# Failures come back as text with one of these markers instead of raising
+ERROR_PREFIXES = ("[EMPTY_RESPONSE]", "[RATE_LIMITED]", "[ERROR]")
+
+
+def is_error_response(text: str) -> bool:
+    return not text or text.startswith(ERROR_PREFIXES)
+
+
+class LLMStreamError(Exception):
+    """A streamed generation failed part-way; carries the marked error text."""
+
+
+def _error_text(e: Exception) -> str:
+    error_message = str(e)
+    if "429" in error_message and "quota" in error_message.lower():
+        return "[RATE_LIMITED] Gemini API quota exceeded. Try again later."
+    return f"[ERROR] {error_message}"
+
+
+def _extract_text(response) -> str:
+    """
+    Pull the generated text out of a Gemini response, or return "" if there is none.
+    """
+    # ✅ Handle the nested RepeatedComposite structure
+    if hasattr(response, 'candidates') and response.candidates:
+        candidate = response.candidates[0]
+
+        if hasattr(candidate, 'content') and candidate.content:
+            content = candidate.content
+
+            if hasattr(content, 'parts') and content.parts:
+                parts = content.parts
+
+                # ✅ Handle RepeatedComposite parts structure
+                if len(parts) > 0:
+                    first_part = parts
+
+                    # Check if first_part is still RepeatedComposite
+                    if hasattr(first_part, '__iter__') and not isinstance(first_part, str):
+                        # It's still a repeated composite, get the first element
+                        try:
+                            actual_part = next(iter(first_part))
+                            if hasattr(actual_part, 'text'):
+                                return actual_part.text
+                        except (StopIteration, TypeError):
+                            pass
+
+                    # ✅ Try direct text access
+                    if hasattr(first_part, 'text'):
+                        return first_part.text
+
+                    # ✅ Try alternative attribute names
+                    for attr in ['text', 'content', 'value']:
+                        if hasattr(first_part, attr):
+                            text_value = getattr(first_part, attr)
+                            if isinstance(text_value, str) and text_value.strip():
+                                return text_value
+    return ""
+
+
+class GeminiLLM:
+    """
+    Google Gemini text generation, whole or streamed, on the event loop.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME):
+        import google.generativeai as genai
+
+        # Configure Gemini API
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not set in environment variables")
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def agenerate(self, prompt: str) -> str:
+        """
+        Returns the generated text or a marked error message; waits on Gemini without holding a thread.
+        """
+        try:
+            response = await self.model.generate_content_async(prompt)
+        except Exception as e:
+            return _error_text(e)
+
+        text = _extract_text(response).strip()
+        return text or "[EMPTY_RESPONSE] No valid text returned by Gemini."
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yields text pieces as Gemini produces them; a failure is yielded as a marked error message.
+        """
+        produced = False
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = _extract_text(chunk)
+                if text:
+                    produced = True
+                    yield text
+        except Exception as e:
+            yield _error_text(e)
+            return
+
+        if not produced:
+            yield "[EMPTY_RESPONSE] No valid text returned by Gemini."
+
+
+class FakeStreamingLLM:
+    """
+    Deterministic stand-in for Gemini. Streams `reply` (or an echo of the prompt's
+    last line) word by word, optionally pausing `delay` seconds between words.
+    With `error`, that marked error text follows the reply, like a Gemini stream failing part-way.
+    """
+
+    def __init__(self, reply: str = None, delay: float = 0.0, error: str = None):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+
+    def _pieces(self, prompt: str) -> Iterator[str]:
+        reply = self.reply
+        if reply is None:
+            last_line = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+            reply = f"Echo: {last_line}"
+
+        for i, word in enumerate(reply.split(" ")):
+            yield word if i == 0 else f" {word}"
+        if self.error:
+            yield self.error
+
+    async def agenerate(self, prompt: str) -> str:
+        return "".join([piece async for piece in self.astream(prompt)]).strip()
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        for piece in self._pieces(prompt):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield piece
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """
+    Shared LLM client, created on first use according to LLM_BACKEND.
+    """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = FakeStreamingLLM() if LLM_BACKEND == "fake" else GeminiLLM()
+    return _llm
+
+
+def set_llm(llm):
+    """
+    Swap the shared LLM client, e.g. for a FakeStreamingLLM in tests.
+    """
+    global _llm
+    _llm = llm
@@ -1,10 +1,20 @@
 # main.py
+import logging
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.upload import router as upload_router
 from app.routes.auth import router as auth_router
 from app.routes.chat import router as chat_router
 from app.routes.message import router as message_router
+from app.routes.metrics import router as metrics_router
+from app.ingestion import ingestion_pool
+from app.qdrant_client import ensure_schema
+from app.embeddings import warm_up, model_status
+from app.pagination import NEXT_CURSOR_HEADER
 import os
 from dotenv import load_dotenv
 
@@ -12,10 +22,36 @@ load_dotenv()
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
+logger = logging.getLogger(__name__)
+
+
+def bootstrap_schema():
+    try:
+        ensure_schema()
+    except Exception as e:
+        # Serve anyway; the first upload retries the setup
+        logger.error(f"Qdrant schema setup failed at startup: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ Startup: bring the Qdrant schema in line and load the embedding model in the
+    # background, so auth and chat routes are served right away. Embedding routes
+    # answer 503 until the model is ready; a failed warm-up keeps retrying.
+    threading.Thread(target=bootstrap_schema, name="qdrant-schema", daemon=True).start()
+    threading.Thread(target=warm_up, name="embedding-warm-up", daemon=True).start()
+
+    yield
+
+    # ✅ Shutdown
+    ingestion_pool.shutdown(wait=False)
+
+
 app = FastAPI(
     title="ChatPDF",
     description="RAG-powered PDF chatbot using HuggingFace + Qdrant + Gemini",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS setup (adjust for production later)
@@ -25,6 +61,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -32,6 +69,7 @@ app.include_router(upload_router, prefix="/api/upload", tags=["Upload PDF"])
 app.include_router(auth_router, prefix="/api/auth", tags=["Auth"])
 app.include_router(chat_router, prefix="/api/chats", tags=["Chats"])
 app.include_router(message_router, prefix="/api/messages", tags=["Messages"])
+app.include_router(metrics_router, prefix="/api/metrics", tags=["Metrics"])
 
 
 # app.include_router(ask_router, prefix="/ask", tags=["Ask Questions"])
@@ -40,3 +78,16 @@ app.include_router(message_router, prefix="/api/messages", tags=["Messages"])
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Chat with PDF backend!"}
+
+
+@app.get("/ready")
+def readiness():
+    """
+    Readiness probe: 200 once the embedding model is loaded and warm, 503 before that
+    """
+    embedding_model = model_status()
+    ready = embedding_model["status"] == "ready"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "embedding_model": embedding_model},
+    )
@@ -2,44 +2,145 @@
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR
-from app.supabase_client import get_supabase
+from app.supabase_client import get_async_supabase, SUPABASE_URL
+from app.cache import TTLCache
+from dotenv import load_dotenv
+import asyncio
+import hashlib
 import logging
+import os
+import time
+import jwt
+
+load_dotenv()
 
 security = HTTPBearer()
 logger = logging.getLogger(__name__)
 
+# "local" verifies the JWT signature and expiry in-process; "remote" asks Supabase Auth on every cache miss
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local")
+# Fall back to the remote check when local verification fails for a reason other than expiry
+AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "false").lower() == "true"
+# Legacy HS256 projects sign with a shared secret; otherwise the project's JWKS is used
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "authenticated")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+_jwks_client = None if SUPABASE_JWT_SECRET else jwt.PyJWKClient(
+    SUPABASE_JWKS_URL, cache_keys=True, lifespan=JWKS_REFRESH_SECONDS
+)
+
+# sha256(token) -> current_user dict; entries never outlive the token's own expiry
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+async def _verify_locally(token: str) -> dict:
+    """
+    Check the token's signature, expiry and audience without a network round trip
+    (apart from the periodic JWKS refresh). Returns the token claims.
+    """
+    if SUPABASE_JWT_SECRET:
+        key, algorithms = SUPABASE_JWT_SECRET, ["HS256"]
+    else:
+        # May fetch the JWKS over the network, so keep it off the event loop
+        signing_key = await asyncio.to_thread(_jwks_client.get_signing_key_from_jwt, token)
+        key, algorithms = signing_key.key, ["RS256", "ES256"]
+
+    return jwt.decode(
+        token,
+        key,
+        algorithms=algorithms,
+        audience=JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def _user_from_claims(claims: dict) -> dict:
+    metadata = claims.get("user_metadata") or {}
+    return {
+        "user_id": claims["sub"],
+        "email": claims.get("email"),
+        "created_at": None,  # not part of the token
+        "last_sign_in_at": None,
+        "email_verified": metadata.get("email_verified", True),
+        "user": claims
+    }
+
+
+async def _verify_remotely(token: str, supabase) -> dict:
+    # Use Supabase to verify the token
+    user_response = await supabase.auth.get_user(token)
+
+    if user_response.user is None:
+        logger.warning("Invalid token provided")
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token"
+        )
+
+    user = user_response.user
+
+    # Return user data in the format your app expects
+    return {
+        "user_id": user.id,
+        "email": user.email,
+        "created_at": user.created_at,
+        "last_sign_in_at": user.last_sign_in_at,
+        "email_verified": user.email_confirmed_at is not None,
+        "user": user  # Full user object if needed elsewhere
+    }
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    supabase = Depends(get_supabase)
+    supabase = Depends(get_async_supabase)
 ):
     """
-    Verify JWT token with Supabase and return current user
+    Verify JWT token and return current user.
+
+    Tokens are verified locally by default and the result is cached until the
+    token expires (at most TOKEN_CACHE_TTL seconds). Note that local verification
+    cannot see server-side sign-outs before the token's expiry.
     """
     try:
         token = credentials.credentials
-        
-        # Use Supabase to verify the token
-        user_response = supabase.auth.get_user(token)
-        
-        if user_response.user is None:
-            logger.warning("Invalid token provided")
-            raise HTTPException(
-                status_code=HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token"
-            )
-        
-        user = user_response.user
-        
-        # Return user data in the format your app expects
-        return {
-            "user_id": user.id,
-            "email": user.email,
-            "created_at": user.created_at,
-            "last_sign_in_at": user.last_sign_in_at,
-            "email_verified": user.email_confirmed_at is not None,
-            "user": user  # Full user object if needed elsewhere
-        }
-        
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+        cached_user = token_cache.get(cache_key)
+        if cached_user is not None:
+            return cached_user
+
+        expires_at = None
+        if AUTH_VERIFY_MODE == "remote":
+            current_user = await _verify_remotely(token, supabase)
+        else:
+            try:
+                claims = await _verify_locally(token)
+                current_user = _user_from_claims(claims)
+                expires_at = claims["exp"]
+            except jwt.ExpiredSignatureError:
+                raise HTTPException(
+                    status_code=HTTP_401_UNAUTHORIZED,
+                    detail="Authentication token expired"
+                )
+            except Exception as e:
+                if not AUTH_REMOTE_FALLBACK:
+                    logger.warning(f"Local token verification failed: {e}")
+                    raise HTTPException(
+                        status_code=HTTP_401_UNAUTHORIZED,
+                        detail="Invalid authentication token"
+                    )
+                logger.info(f"Local token verification failed ({e}), falling back to Supabase Auth")
+                current_user = await _verify_remotely(token, supabase)
+
+        ttl = TOKEN_CACHE_TTL if expires_at is None else min(TOKEN_CACHE_TTL, expires_at - time.time())
+        if ttl > 0:
+            token_cache.set(cache_key, current_user, ttl=ttl)
+        return current_user
+
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
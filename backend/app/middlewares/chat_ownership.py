@@ -0,0 +1,69 @@
+# chat_ownership.py
+from fastapi import HTTPException, Depends
+from starlette.status import HTTP_403_FORBIDDEN
+from app.middlewares.auth_middleware import get_current_user
+from app.supabase_client import get_async_supabase
+from app.cache import TTLCache
+from dotenv import load_dotenv
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHAT_OWNER_CACHE_SIZE = int(os.getenv("CHAT_OWNER_CACHE_SIZE", "10000"))
+CHAT_OWNER_CACHE_TTL = int(os.getenv("CHAT_OWNER_CACHE_TTL", "900"))
+
+# chat_id -> owning user_id. Ownership never changes, so the TTL only bounds staleness after deletes elsewhere.
+chat_owner_cache = TTLCache(CHAT_OWNER_CACHE_SIZE, CHAT_OWNER_CACHE_TTL)
+
+
+def remember_chat_owner(chat_id: str, user_id: str):
+    chat_owner_cache.set(str(chat_id), str(user_id))
+
+
+def forget_chat_owner(chat_id: str):
+    chat_owner_cache.pop(str(chat_id))
+
+
+async def ensure_chat_owner(
+    chat_id: str,
+    user_id: str,
+    supabase,
+    detail: str = "Not authorized to access this chat"
+):
+    """
+    Raise 403 unless user_id owns chat_id. Answered from the ownership cache when
+    possible; only a miss queries the chats table.
+    """
+    owner_id = chat_owner_cache.get(chat_id)
+
+    if owner_id is None:
+        try:
+            chat_res = await supabase.table("chats").select("user_id").eq("id", chat_id).single().execute()
+            owner_id = chat_res.data["user_id"] if chat_res.data else None
+        except Exception as e:
+            # .single() raises when the chat does not exist
+            logger.warning(f"Chat ownership lookup failed for chat {chat_id}: {e}")
+            owner_id = None
+
+        if owner_id is not None:
+            remember_chat_owner(chat_id, owner_id)
+
+    if owner_id is None or str(owner_id) != str(user_id):
+        logger.warning(f"User {user_id} is NOT owner of chat {chat_id}")
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail=detail)
+
+
+async def require_chat_owner(
+    chat_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase = Depends(get_async_supabase)
+) -> str:
+    """
+    Route dependency: resolves chat_id from the path or query string and checks
+    the current user owns it.
+    """
+    await ensure_chat_owner(chat_id, current_user["user_id"], supabase)
+    return chat_id
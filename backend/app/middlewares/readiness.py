@@ -0,0 +1,19 @@
+# readiness.py
+from fastapi import HTTPException
+
+from app.embeddings import model_ready, model_status
+
+
+def require_embedding_model():
+    """
+    Reject requests that need the embedding model while it is still loading, instead
+    of holding them until the warm-up finishes.
+    """
+    if not model_ready():
+        status = model_status()
+        detail = (
+            "The embedding model failed to load."
+            if status["status"] == "failed"
+            else "The service is starting up. Please try again shortly."
+        )
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
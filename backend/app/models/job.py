@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    chat_id: str
+    file_name: Optional[str] = None
+    stage: str  # queued, parsing, embedding, storing, finalizing, completed, failed
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0  # new chunks embedded and written so far
+    chunks_reused: int = 0  # already indexed from a previous version of the document
+    file_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
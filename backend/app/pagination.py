@@ -0,0 +1,95 @@
+# pagination.py
+import base64
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Response header carrying the cursor for the following page, if there is one
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """
+    Keyset pagination parameters shared by list endpoints.
+
+    `before` pages towards older rows and `after` towards newer ones; the cursor for
+    the following page in the same direction is returned in the X-Next-Cursor header.
+    Without `limit`, `before` or `after` the whole list is returned, as before paging existed.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(
+            None, ge=1, le=MAX_PAGE_SIZE,
+            description=f"Maximum number of rows to return (default {DEFAULT_PAGE_SIZE} when paging with a cursor).",
+        ),
+        before: Optional[str] = Query(None, description="Only return rows older than this cursor."),
+        after: Optional[str] = Query(None, description="Only return rows newer than this cursor."),
+    ):
+        if before and after:
+            raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both.")
+        self.paged = bool(limit or before or after)
+        self.limit = limit or DEFAULT_PAGE_SIZE
+        self.before = decode_cursor(before) if before else None
+        self.after = decode_cursor(after) if after else None
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([str(row["created_at"]), str(row["id"])]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        # Both are spliced into a PostgREST filter, so accept nothing but a timestamp and a UUID
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(row_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def _keyset_filter(op: str, cursor: tuple) -> str:
+    # (created_at, id) <op> (cursor_created_at, cursor_id), written as a PostgREST or-filter
+    created_at, row_id = cursor
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}."{row_id}")'
+
+
+async def fetch_page(query, page: PageParams, newest_first: bool):
+    """
+    Run a filtered select builder as one keyset page ordered by (created_at, id).
+    Returns (rows, next_cursor) with rows newest-first or oldest-first as requested.
+    """
+    if not page.paged:
+        res = await query.order("created_at", desc=newest_first).order("id", desc=newest_first).execute()
+        return res.data or [], None
+
+    if page.after:
+        query = query.or_(_keyset_filter("gt", page.after)).order("created_at").order("id")
+    else:
+        if page.before:
+            query = query.or_(_keyset_filter("lt", page.before))
+        query = query.order("created_at", desc=True).order("id", desc=True)
+
+    # One extra row tells us whether another page exists without a count query
+    res = await query.limit(page.limit + 1).execute()
+    rows = res.data or []
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+
+    fetched_newest_first = page.after is None
+    if fetched_newest_first != newest_first:
+        rows.reverse()
+    return rows, next_cursor
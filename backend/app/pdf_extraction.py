@@ -0,0 +1,88 @@
+# pdf_extraction.py
+import io
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 0 means one worker per CPU core; 1 disables parallel extraction entirely
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+# Smaller documents are extracted serially; spinning up workers would cost more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+# "spawn" is safe to use from the multi-threaded ingestion pool; "fork" starts faster
+PDF_EXTRACT_START_METHOD = os.getenv("PDF_EXTRACT_START_METHOD", "spawn")
+
+# Per-process reader, opened once by _init_worker and reused for every page range
+_worker_reader = None
+
+
+def _init_worker(source):
+    global _worker_reader
+    from PyPDF2 import PdfReader
+
+    # A path lets every worker read the spooled upload itself instead of receiving a copy
+    _worker_reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def _extract_page_range(start: int, end: int) -> list:
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pdf_pages(fileobj, workers: int = PDF_EXTRACT_WORKERS) -> Iterator[str]:
+    """
+    Yield the text of every page in order.
+
+    Documents with at least PDF_PARALLEL_MIN_PAGES pages are split into page ranges
+    that run across a process pool; each worker parses the PDF bytes itself once.
+    Only a small window of ranges is in flight at a time so memory stays bounded
+    even when the consumer is slower than extraction.
+    """
+    from PyPDF2 import PdfReader  # imported on the first PDF rather than at startup
+
+    reader = PdfReader(fileobj)
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    source = getattr(fileobj, "name", None)
+    if not isinstance(source, str):
+        fileobj.seek(0)
+        source = fileobj.read()
+    del reader
+
+    workers = min(workers, -(-page_count // PDF_PAGES_PER_TASK))
+    logger.info(f"Extracting {page_count} PDF pages with {workers} worker processes")
+
+    ranges = deque(
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    )
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(PDF_EXTRACT_START_METHOD),
+        initializer=_init_worker,
+        initargs=(source,),
+    )
+    in_flight = deque()
+
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < workers * 2:
+                in_flight.append(pool.submit(_extract_page_range, *ranges.popleft()))
+
+            # Results are consumed in submission order, which is page order
+            yield from in_flight.popleft().result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,43 +1,94 @@
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http.models import Distance, VectorParams, CollectionStatus, PayloadSchemaType
 
+from app.embeddings import EMBEDDING_DIM, NORMALIZE_EMBEDDINGS
+
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "text_chunks"
+# Normalized embeddings make cosine and dot product equivalent, and dot is cheaper to score
+EMBEDDING_DISTANCE = Distance.DOT if NORMALIZE_EMBEDDINGS else Distance.COSINE
 
 
 qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+# Used on the request path so searches never tie up a threadpool worker
+async_qdrant = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
 
 
+# ✅ The collection as the app expects it; ensure_schema() makes Qdrant match this
+VECTORS_CONFIG = VectorParams(
+    size=EMBEDDING_DIM,  # Must match your embedding model output
+    distance=EMBEDDING_DISTANCE,
+)
+PAYLOAD_INDEXES = {
+    "chat_id": PayloadSchemaType.KEYWORD,  # every search and delete filters on it
+}
+
+# Set once the schema has been verified; cleared by mark_schema_stale() after a Qdrant error
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 
 def ensure_collection_exists():
     existing = qdrant.get_collections()
     if COLLECTION_NAME not in [col.name for col in existing.collections]:
-        qdrant.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(
-                size=384,  # Must match your embedding model output
-                distance=Distance.COSINE
-            )
-        )
+        qdrant.create_collection(collection_name=COLLECTION_NAME, vectors_config=VECTORS_CONFIG)
+        logger.info(f"Created Qdrant collection {COLLECTION_NAME}")
+        return
 
+    vectors = qdrant.get_collection(COLLECTION_NAME).config.params.vectors
+    if getattr(vectors, "size", EMBEDDING_DIM) != EMBEDDING_DIM:
+        raise RuntimeError(
+            f"Collection {COLLECTION_NAME} stores {vectors.size}-dimensional vectors, "
+            f"the embedding model produces {EMBEDDING_DIM}"
+        )
 
 
-# Create payload index on chat_id field for filtering
+# Create the payload indexes used for filtering
 def ensure_payload_index():
     try:
-        qdrant.create_payload_index(
-            collection_name=COLLECTION_NAME,
-            field_name="chat_id",
-            field_schema=PayloadSchemaType.KEYWORD,  
-        )
+        indexed = qdrant.get_collection(COLLECTION_NAME).payload_schema or {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in indexed:
+                qdrant.create_payload_index(
+                    collection_name=COLLECTION_NAME,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                )
 
     except Exception as e:
         raise RuntimeError(f"Failed to create payload index: {e}")
 
+
+def ensure_schema():
+    """
+    Create or verify the collection and its payload indexes. Runs at startup; after
+    that it is a no-op until mark_schema_stale() asks for another check.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        ensure_collection_exists()
+        ensure_payload_index()
+        _schema_ready = True
+        logger.info(f"Qdrant schema for {COLLECTION_NAME} is ready")
+
+
+def mark_schema_stale():
+    """Re-check the schema before the next write, e.g. after the collection went missing."""
+    global _schema_ready
+    _schema_ready = False
@@ -1,54 +1,89 @@
-from typing import List
-from app.embeddings import model  # your embedding model instance (e.g., SentenceTransformer)
-from app.qdrant_client import qdrant, COLLECTION_NAME  # your Qdrant client and collection name
-from app.supabase_client import supabase  # ✅ Add Supabase import for message history
+from typing import AsyncIterator, List, NamedTuple, Optional
+from app.embedding_batcher import query_batcher
+from app.cache import (
+    query_vector_cache, retrieval_cache, answer_cache, semantic_answer_cache,
+    normalize_query, ANSWER_CACHE_SEMANTIC,
+)
+from app.qdrant_client import async_qdrant, COLLECTION_NAME, mark_schema_stale  # your Qdrant client and collection name
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-import google.generativeai as genai
-import time
-
+from app.llm import get_llm, is_error_response, LLMStreamError, ERROR_PREFIXES
+from app.history import build_history_context
+from app.context import pack_context
+import asyncio
+import hashlib
+import logging
 import os
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not set in environment variables")
+logger = logging.getLogger(__name__)
+
+# Per-stage budgets for the retrieval fan-out
+HISTORY_TIMEOUT_SECONDS = float(os.getenv("HISTORY_TIMEOUT_SECONDS", "2"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "15"))
 
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Create model instance
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+class PreparedPrompt(NamedTuple):
+    prompt: Optional[str]  # None when `reply` can be returned without calling the LLM
+    reply: Optional[str] = None
+    query_vector: object = None
+    chunk_ids: tuple = ()
 
-def generate_assistant_response(query: str, chat_id: str, top_k: int = 5) -> str:
+
+async def generate_assistant_response(query: str, chat_id: str, top_k: int = 5) -> str:
     """
     Given a user query and chat_id, perform vector retrieval of relevant chunks
     and then generate the assistant's response using Gemini model with conversation context.
     """
-    
-    # ✅ Step 1: Get recent conversation history
-    try:
-
-        recent_messages = supabase.table("messages")\
-            .select("role, content")\
-            .eq("chat_id", chat_id)\
-            .order("created_at")\
-            .limit(10)\
-            .execute()
-        
-        # Build conversation context (exclude the current message)
-        conversation_history = ""
-        if recent_messages.data and len(recent_messages.data) > 1:
-            for msg in recent_messages.data:  # Exclude the last message (current user message)
-                conversation_history += f"{msg['role']}: {msg['content']}\n"
+    prepared = await prepare_prompt(query, chat_id, top_k)
+    if prepared.prompt is None:
+        return prepared.reply
 
-            
-    except Exception as e:
+    # Call the Gemini Model for text generation (or reuse a cached answer)
+    return await generate_cached_answer(prepared.prompt, chat_id, prepared.query_vector, prepared.chunk_ids)
 
-        conversation_history = ""
-    
-    # ✅ Step 2: Vector search with retry logic (unchanged)
+
+async def stream_assistant_response(query: str, chat_id: str, top_k: int = 5) -> AsyncIterator[str]:
+    """
+    Same as generate_assistant_response, but yields the answer in pieces as the
+    model produces them. Cached answers are yielded in one piece.
+    Raises LLMStreamError if the model fails part-way; the partial answer is not cached.
+    """
+    prepared = await prepare_prompt(query, chat_id, top_k)
+    if prepared.prompt is None:
+        yield prepared.reply
+        return
+
+    cached = lookup_cached_answer(prepared.prompt, chat_id, prepared.query_vector, prepared.chunk_ids)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for piece in get_llm().astream(prepared.prompt):
+        # Gemini reports failures as a marked piece, possibly after some real text
+        if piece.startswith(ERROR_PREFIXES):
+            raise LLMStreamError(piece)
+        parts.append(piece)
+        yield piece
+
+    store_answer(prepared.prompt, chat_id, "".join(parts).strip(), prepared.query_vector, prepared.chunk_ids)
+
+
+async def fetch_conversation_history(chat_id: str) -> str:
+    """
+    Rolling summary plus the most recent turns that fit the history token budget.
+    The current message is not stored yet, so it is never part of the history.
+    """
+    return await build_history_context(chat_id)
+
+
+async def retrieve_chunks(query: str, chat_id: str, top_k: int = 5):
+    """
+    Embed the query and search the chat's nearest chunks in Qdrant, with retry logic.
+    Returns (query_vector, hits); raises once all retries are exhausted.
+    """
     filter_obj = Filter(
         must=[
             FieldCondition(
@@ -57,41 +92,72 @@ def generate_assistant_response(query: str, chat_id: str, top_k: int = 5) -> str
             )
         ]
     )
-    
-    # Step 2a: Embed the query (list of one item)
-    query_vector = model.encode([query])[0]
-    
-    # Step 2b: Search nearest chunks in Qdrant with retry logic
+
+    # Embed the query (cached, and micro-batched with concurrent requests)
+    normalized_query = normalize_query(query)
+    query_vector = query_vector_cache.get(normalized_query)
+    if query_vector is None:
+        query_vector = await query_batcher.aencode(query)
+        query_vector_cache.set(normalized_query, query_vector)
+
+    # Search nearest chunks in Qdrant (unless recently cached)
+    retrieval_key = (chat_id, normalized_query, top_k)
+    search_result = retrieval_cache.get(retrieval_key)
+    if search_result is not None:
+        return query_vector, search_result
+
     max_retries = 3
     retry_delay = 1  # seconds
-    search_result = None
-    
+
     for attempt in range(max_retries):
         try:
-
-            
-            search_result = qdrant.search(
+            search_result = await async_qdrant.search(
                 collection_name=COLLECTION_NAME,
                 query_vector=query_vector,
                 query_filter=filter_obj,
                 limit=top_k,
             )
-            
+            retrieval_cache.set(retrieval_key, search_result)
+            return query_vector, search_result
 
-            break  # Success - exit retry loop
-            
         except Exception as e:
             if attempt == max_retries - 1:  # Last attempt failed
+                mark_schema_stale()
+                raise
+            logger.warning(f"Qdrant search attempt {attempt + 1} failed: {e}")
+            await asyncio.sleep(retry_delay)
+            retry_delay *= 2  # Exponential backoff
 
-                return "I'm having trouble accessing the document right now. Please try again in a moment."
-            else:
 
+async def prepare_prompt(query: str, chat_id: str, top_k: int = 5) -> PreparedPrompt:
+    """
+    Gather conversation history and the top_k relevant chunks for a query and build
+    the prompt, or a direct reply when there is nothing to ask the model.
+    """
+
+    # ✅ Steps 1 & 2: History fetch and embed+search don't depend on each other, so run them concurrently
+    history_result, retrieval_result = await asyncio.gather(
+        asyncio.wait_for(fetch_conversation_history(chat_id), HISTORY_TIMEOUT_SECONDS),
+        asyncio.wait_for(retrieve_chunks(query, chat_id, top_k), RETRIEVAL_TIMEOUT_SECONDS),
+        return_exceptions=True,
+    )
+
+    # Late or failed history only costs conversational context; answer from the document alone
+    if isinstance(history_result, BaseException):
+        logger.warning(f"Conversation history unavailable for chat {chat_id}: {history_result!r}")
+        conversation_history = ""
+    else:
+        conversation_history = history_result
+
+    if isinstance(retrieval_result, BaseException):
+        logger.error(f"Chunk retrieval failed for chat {chat_id}: {retrieval_result!r}")
+        return PreparedPrompt(None, "I'm having trouble accessing the document right now. Please try again in a moment.")
+
+    query_vector, search_result = retrieval_result
 
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-    
     # Step 3: Extract text payloads of found chunks
     chunks_texts: List[str] = [hit.payload.get("text", "") for hit in search_result if hit.payload]
+    chunk_ids = tuple(str(hit.id) for hit in search_result if hit.payload)
     
     if not chunks_texts:
         # ✅ Even without document context, use conversation history
@@ -101,15 +167,16 @@ def generate_assistant_response(query: str, chat_id: str, top_k: int = 5) -> str
                 f"Conversation History:\n{conversation_history}\n\n"
                 f"Current Question: {query}\nAnswer:"
             )
-            return call_gemini_text_generation(prompt_text)
+            return PreparedPrompt(prompt_text)
         else:
-            return "I couldn't find relevant information in the uploaded file to answer that."
+            return PreparedPrompt(None, "I couldn't find relevant information in the uploaded file to answer that.")
     
 
 
     
     # ✅ Step 4: Build enhanced context prompt with conversation history
-    document_context = "\n\n".join(chunks_texts)
+    # Overlapping neighbours are merged and the context is held to its token budget
+    document_context = pack_context(search_result)
     
     if conversation_history.strip():
         prompt_text = (
@@ -135,65 +202,53 @@ def generate_assistant_response(query: str, chat_id: str, top_k: int = 5) -> str
 
 
     
-    # Step 5: Call the Gemini Model for text generation
-    return call_gemini_text_generation(prompt_text)
+    return PreparedPrompt(prompt_text, None, query_vector, chunk_ids)
+
+
+def _prompt_key(prompt: str, chat_id: str) -> tuple:
+    return (chat_id, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+
+def _use_semantic_cache(query_vector, chunk_ids: tuple) -> bool:
+    return bool(ANSWER_CACHE_SEMANTIC and query_vector is not None and chunk_ids)
+
+
+def lookup_cached_answer(prompt: str, chat_id: str, query_vector=None, chunk_ids: tuple = ()) -> Optional[str]:
+    """
+    Return a cached answer for an identical prompt, or (in semantic mode) for a
+    near-duplicate question over the same retrieved chunks.
+    """
+    cached = answer_cache.get(_prompt_key(prompt, chat_id))
+    if cached is None and _use_semantic_cache(query_vector, chunk_ids):
+        cached = semantic_answer_cache.lookup(chat_id, chunk_ids, query_vector)
+    return cached
+
+
+def store_answer(prompt: str, chat_id: str, answer: str, query_vector=None, chunk_ids: tuple = ()):
+    # Gemini failures come back as marked strings and must never be cached
+    if is_error_response(answer):
+        return
+    answer_cache.set(_prompt_key(prompt, chat_id), answer)
+    if _use_semantic_cache(query_vector, chunk_ids):
+        semantic_answer_cache.store(chat_id, chunk_ids, query_vector, answer)
+
+
+async def generate_cached_answer(prompt: str, chat_id: str, query_vector=None, chunk_ids: tuple = ()) -> str:
+    """
+    Reuse a cached answer when possible; otherwise call Gemini and cache the result.
+    """
+    cached = lookup_cached_answer(prompt, chat_id, query_vector, chunk_ids)
+    if cached is not None:
+        return cached
+
+    answer = await call_gemini_text_generation(prompt)
+    store_answer(prompt, chat_id, answer, query_vector, chunk_ids)
+    return answer
 
 
-def call_gemini_text_generation(prompt: str) -> str:
+async def call_gemini_text_generation(prompt: str) -> str:
     """
     Calls Google Gemini API to generate text given a prompt.
     Returns the generated text or an error message.
     """
-    try:
-        # Send prompt to Gemini
-        response = gemini_model.generate_content(prompt)
-        
-        # ✅ Handle the nested RepeatedComposite structure
-        if hasattr(response, 'candidates') and response.candidates:
-            candidate = response.candidates[0]
-            
-            if hasattr(candidate, 'content') and candidate.content:
-                content = candidate.content
-                
-                if hasattr(content, 'parts') and content.parts:
-                    parts = content.parts
-                    
-                    # ✅ Handle RepeatedComposite parts structure
-                    if len(parts) > 0:
-                        first_part = parts
-                        
-                        # Check if first_part is still RepeatedComposite
-                        if hasattr(first_part, '__iter__') and not isinstance(first_part, str):
-                            # It's still a repeated composite, get the first element
-                            try:
-                                actual_part = next(iter(first_part))
-                                if hasattr(actual_part, 'text'):
-                                    generated_text = actual_part.text.strip()
-
-                                    return generated_text
-                            except (StopIteration, TypeError):
-                                pass
-                        
-                        # ✅ Try direct text access
-                        if hasattr(first_part, 'text'):
-                            generated_text = first_part.text.strip()
-
-                            return generated_text
-                        
-                        # ✅ Try alternative attribute names
-                        for attr in ['text', 'content', 'value']:
-                            if hasattr(first_part, attr):
-                                text_value = getattr(first_part, attr)
-                                if isinstance(text_value, str) and text_value.strip():
-
-                                    return text_value.strip()
-        
-        return "[EMPTY_RESPONSE] No valid text returned by Gemini."
-
-    except Exception as e:
-        error_message = str(e)
-
-        
-        if "429" in error_message and "quota" in error_message.lower():
-            return "[RATE_LIMITED] Gemini API quota exceeded. Try again later."
-        return f"[ERROR] {error_message}"
+    return await get_llm().agenerate(prompt)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from starlette.status import HTTP_400_BAD_REQUEST
 from app.models.user import SignupRequest, LoginRequest, AuthResponse, RefreshTokenRequest
-from app.supabase_client import get_supabase
+from app.supabase_client import get_async_supabase
 from app.middlewares.auth_middleware import get_current_user
 import logging
 
@@ -12,16 +12,16 @@ logger = logging.getLogger(__name__)
 from fastapi import APIRouter, HTTPException, Depends
 from starlette.status import HTTP_400_BAD_REQUEST
 from ..models.user import SignupRequest, LoginRequest, AuthResponse
-from ..supabase_client import get_supabase
+from ..supabase_client import get_async_supabase
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.post("/signup", response_model=AuthResponse)
-async def signup(payload: SignupRequest, supabase=Depends(get_supabase)):
+async def signup(payload: SignupRequest, supabase=Depends(get_async_supabase)):
     try:
-        result = supabase.auth.sign_up({
+        result = await supabase.auth.sign_up({
             "email": payload.email,
             "password": payload.password
         })
@@ -76,10 +76,10 @@ async def signup(payload: SignupRequest, supabase=Depends(get_supabase)):
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=f"Signup failed: {str(e)}")
 
 @router.post("/login", response_model=AuthResponse)
-async def login(payload: LoginRequest, supabase=Depends(get_supabase)):
+async def login(payload: LoginRequest, supabase=Depends(get_async_supabase)):
     try:
         logger.info(f"Login attempt for email: {payload.email}")
-        result = supabase.auth.sign_in_with_password({
+        result = await supabase.auth.sign_in_with_password({
             "email": payload.email,
             "password": payload.password
         })
@@ -153,7 +153,7 @@ async def get_profile(current_user = Depends(get_current_user)):
 
 
 @router.post("/refresh-token")
-async def refresh_access_token(request: RefreshTokenRequest, supabase=Depends(get_supabase)):
+async def refresh_access_token(request: RefreshTokenRequest, supabase=Depends(get_async_supabase)):
     """
     Refresh access token using refresh token
     """
@@ -162,7 +162,7 @@ async def refresh_access_token(request: RefreshTokenRequest, supabase=Depends(ge
 
         
         # Use Supabase Python client to refresh the session
-        result = supabase.auth.refresh_session(request.refresh_token)  # ✅ Use request.refresh_token
+        result = await supabase.auth.refresh_session(request.refresh_token)  # ✅ Use request.refresh_token
 
         
         if result.session is None:
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from app.middlewares.auth_middleware import get_current_user
+from app.middlewares.chat_ownership import remember_chat_owner, forget_chat_owner
 from app.models.chat import ChatCreate, ChatInDB
-from app.supabase_client import supabase
+from app.supabase_client import get_async_supabase
+from app.pagination import PageParams, fetch_page, NEXT_CURSOR_HEADER
 from app.utils import delete_file_and_chunks
 from uuid import uuid4
 from datetime import datetime
@@ -11,7 +13,11 @@ router = APIRouter()
 
 
 @router.post("/", response_model=ChatInDB)
-def create_chat(chat: ChatCreate, current_user: dict = Depends(get_current_user)):
+async def create_chat(
+    chat: ChatCreate,
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
     user_id = current_user["user_id"]
     chat_id = str(uuid4())
     created_at = datetime.now(pytz.timezone('Asia/Kolkata')).isoformat()
@@ -28,35 +34,56 @@ def create_chat(chat: ChatCreate, current_user: dict = Depends(get_current_user)
         data["file_name"] = chat.file_name
 
     try:
-        res = supabase.table("chats").insert(data).execute()
+        res = await supabase.table("chats").insert(data).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create chat: {e}")
 
+    remember_chat_owner(chat_id, user_id)
     inserted = res.data if hasattr(res, "data") else res
     return inserted[0] if inserted and isinstance(inserted, list) else inserted
 
 
 @router.get("/", response_model=list[ChatInDB])
-def get_user_chats(current_user: dict = Depends(get_current_user)):
+async def get_user_chats(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
+    """
+    The user's chats, newest first; all of them unless paging parameters are given.
+    Pass X-Next-Cursor back as `before` to load older chats.
+    """
     user_id = current_user["user_id"]
     try:
-        res = supabase.table("chats").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        query = supabase.table("chats").select("*").eq("user_id", user_id)
+        chats, next_cursor = await fetch_page(query, page, newest_first=True)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch chats: {e}")
 
-    chats = res.data if hasattr(res, "data") else res
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
+    # Warm the ownership cache so follow-up message/upload calls skip the chats lookup
+    for chat in chats or []:
+        remember_chat_owner(chat["id"], user_id)
 
     return chats
 
 
 @router.delete("/{chat_id}")
-def delete_chat(chat_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_chat(
+    chat_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
     user_id = current_user["user_id"]
     
     try:
         # Get chat data
-        chat_response = supabase.table("chats").select("file_url").eq("id", chat_id).eq("user_id", user_id).execute()
+        chat_response = await supabase.table("chats").select("file_url").eq("id", chat_id).eq("user_id", user_id).execute()
         
         if not chat_response.data:
             raise HTTPException(status_code=404, detail="Chat not found")
@@ -64,10 +91,11 @@ def delete_chat(chat_id: str, current_user: dict = Depends(get_current_user)):
         file_url = chat_response.data[0].get("file_url")
         
         # Delete from database
-        supabase.table("chats").delete().eq("id", chat_id).eq("user_id", user_id).execute()
+        await supabase.table("chats").delete().eq("id", chat_id).eq("user_id", user_id).execute()
+        forget_chat_owner(chat_id)
         
         # Clean up associated resources
-        cleanup_success = delete_file_and_chunks(file_url, chat_id)
+        cleanup_success = await delete_file_and_chunks(file_url, chat_id)
         
         return {
             "message": "Chat deleted successfully",
@@ -82,10 +110,14 @@ def delete_chat(chat_id: str, current_user: dict = Depends(get_current_user)):
 
 
 @router.put("/{chat_id}", response_model=ChatInDB)
-def update_chat_title(chat_id: str, title: str, current_user: dict = Depends(get_current_user)):
+async def update_chat_title(
+    chat_id: str, title: str,
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
     user_id = current_user["user_id"]
     try:
-        res = supabase.table("chats").update({"title": title}).eq("id", chat_id).eq("user_id", user_id).execute()
+        res = await supabase.table("chats").update({"title": title}).eq("id", chat_id).eq("user_id", user_id).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update chat title: {e}")
 
@@ -94,10 +126,14 @@ def update_chat_title(chat_id: str, title: str, current_user: dict = Depends(get
 
 
 @router.get("/{chat_id}", response_model=ChatInDB)
-def get_chat(chat_id: str, current_user: dict = Depends(get_current_user)):
+async def get_chat(
+    chat_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
     user_id = current_user["user_id"]
     try:
-        res = supabase.table("chats").select("*").eq("id", chat_id).eq("user_id", user_id).single().execute()
+        res = await supabase.table("chats").select("*").eq("id", chat_id).eq("user_id", user_id).single().execute()
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Chat not found: {e}")
 
@@ -105,4 +141,5 @@ def get_chat(chat_id: str, current_user: dict = Depends(get_current_user)):
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
+    remember_chat_owner(chat_id, user_id)
     return chat
@@ -1,92 +1,164 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from app.middlewares.auth_middleware import get_current_user
+from app.middlewares.chat_ownership import ensure_chat_owner, require_chat_owner
+from app.middlewares.readiness import require_embedding_model
 from app.models.message import MessageCreate, MessageInDB
-from app.supabase_client import supabase
+from app.supabase_client import get_async_supabase
+from app.pagination import PageParams, fetch_page, NEXT_CURSOR_HEADER
 from uuid import uuid4
-from datetime import datetime
-from app.rag import generate_assistant_response
+from datetime import datetime, timedelta
+from app.rag import generate_assistant_response, stream_assistant_response
+import json
+import logging
 
 router = APIRouter()
-
-@router.post("/", response_model=list[MessageInDB])
-def create_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
+logger = logging.getLogger(__name__)
+
+@router.post("/", response_model=list[MessageInDB], dependencies=[Depends(require_embedding_model)])
+async def create_message(
+    message: MessageCreate,
+    include_history: bool = Query(True, description="Return the whole conversation instead of just the new user/assistant pair."),
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
     chat_id = message.chat_id
 
     
     # verify current user owns the chat before inserting message
-    chat_res = supabase.table("chats").select("user_id").eq("id", chat_id).single().execute()
-    if not chat_res.data or chat_res.data["user_id"] != current_user["user_id"]:
-        raise HTTPException(status_code=403, detail="Not authorized to add messages to this chat")
+    await ensure_chat_owner(chat_id, current_user["user_id"], supabase, "Not authorized to add messages to this chat")
 
     # ✅ STEP 1: Generate assistant response FIRST (before any database writes)
     try:
-        assistant_text = generate_assistant_response(message.content, chat_id)
+        assistant_text = await generate_assistant_response(message.content, chat_id)
 
         
     except Exception as e:
 
         raise HTTPException(status_code=500, detail=f"Assistant generation failed: {e}")
 
-    # ✅ STEP 2: Only create user message AFTER assistant response succeeds
+    # ✅ STEP 2: Only store the message pair AFTER assistant response succeeds
+    user_message, assistant_message = await _store_message_pair(supabase, chat_id, message, assistant_text)
+
+    if not include_history:
+        return [user_message, assistant_message]
+
+    # ✅ STEP 3: Return updated list of messages for this chat
+    try:
+        msg_res = await supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
+        messages = msg_res.data if hasattr(msg_res, "data") else msg_res
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch updated messages: {e}")
+
+    return messages
+
+
+async def _store_message_pair(supabase, chat_id: str, message: MessageCreate, assistant_text: str):
+    """
+    Persist the user message and the assistant reply together in one insert; returns both rows.
+    """
+    # The assistant reply is stamped just after the user message so the pair always sorts in order
+    created_at = datetime.utcnow()
     user_message_data = {
         "id": str(uuid4()),
         "chat_id": chat_id,
         "role": message.role,
         "content": message.content,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": created_at.isoformat()
     }
-
-    try:
-        res = supabase.table("messages").insert(user_message_data).execute()
-
-    except Exception as e:
-
-        # Assistant response was generated but user message failed to store
-        # This is a rare edge case - you might want to handle this
-        raise HTTPException(status_code=500, detail=f"Failed to store user message: {e}")
-
-    # ✅ STEP 3: Insert assistant message (both messages as a pair)
     assistant_message_data = {
         "id": str(uuid4()),
         "chat_id": chat_id,
         "role": "assistant",
         "content": assistant_text,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": (created_at + timedelta(microseconds=1)).isoformat()
     }
-    
+
     try:
-        supabase.table("messages").insert(assistant_message_data).execute()
+        res = await supabase.table("messages").insert([user_message_data, assistant_message_data]).execute()
 
     except Exception as e:
 
-        # Both user message and assistant response exist, but assistant message failed to store
-        # This creates an inconsistent state - user message without assistant response in DB
-        raise HTTPException(status_code=500, detail=f"Failed to store assistant message: {e}")
+        # Assistant response was generated but the pair failed to store; a single insert
+        # means we never end up with a user message that has no reply
+        raise HTTPException(status_code=500, detail=f"Failed to store messages: {e}")
 
-    # ✅ STEP 4: Return updated list of messages for this chat
-    try:
-        msg_res = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
-        messages = msg_res.data if hasattr(msg_res, "data") else msg_res
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch updated messages: {e}")
+    if res.data and len(res.data) == 2:
+        return res.data[0], res.data[1]
+    return user_message_data, assistant_message_data
 
-    return messages
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-@router.get("/{chat_id}", response_model=list[MessageInDB])
-def get_messages(chat_id: str, current_user: dict = Depends(get_current_user)):
-    # Verify chat ownership before fetching messages
-    chat_res = supabase.table("chats").select("user_id").eq("id", chat_id).single().execute()
-    
-    if not chat_res.data or chat_res.data["user_id"] != current_user["user_id"]:
-        raise HTTPException(status_code=403, detail="Not authorized to view messages of this chat")
 
+@router.post("/stream", dependencies=[Depends(require_embedding_model)])
+async def create_message_stream(
+    message: MessageCreate,
+    current_user: dict = Depends(get_current_user),
+    supabase=Depends(get_async_supabase)
+):
+    """
+    Server-sent-events variant of create_message.
+
+    Emits `token` events with answer text as the model produces it, then persists the
+    user/assistant pair and emits a final `done` event with both stored messages.
+    Failures after the stream has started are reported as an `error` event, and
+    nothing is stored for them.
+    """
+    chat_id = message.chat_id
+
+    # verify current user owns the chat before streaming anything
+    await ensure_chat_owner(chat_id, current_user["user_id"], supabase, "Not authorized to add messages to this chat")
+
+    async def event_stream():
+        parts = []
+        try:
+            async for piece in stream_assistant_response(message.content, chat_id):
+                parts.append(piece)
+                yield _sse("token", {"text": piece})
+        except Exception as e:
+            logger.error(f"Assistant streaming failed for chat {chat_id}: {e}")
+            yield _sse("error", {"detail": f"Assistant generation failed: {e}"})
+            return
+
+        # Persist only once the full answer exists, same as the blocking endpoint
+        try:
+            user_message, assistant_message = await _store_message_pair(supabase, chat_id, message, "".join(parts).strip())
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+            return
+
+        yield _sse("done", {"user_message": user_message, "assistant_message": assistant_message})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{chat_id}", response_model=list[MessageInDB])
+async def get_messages(
+    response: Response,
+    chat_id: str = Depends(require_chat_owner),  # Verify chat ownership before fetching messages
+    page: PageParams = Depends(),
+    supabase=Depends(get_async_supabase)
+):
+    """
+    Messages of a chat in chronological order. Without paging parameters every message
+    is returned. With `limit` alone it is the most recent `limit` messages; pass
+    X-Next-Cursor back as `before` to load older ones.
+    """
     try:
-        res = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
-       
+        query = supabase.table("messages").select("*").eq("chat_id", chat_id)
+        messages, next_cursor = await fetch_page(query, page, newest_first=False)
+    except HTTPException:
+        raise
     except Exception as e:
 
         raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {e}")
 
-    messages = res.data if hasattr(res, "data") else res
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return messages
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from app.middlewares.auth_middleware import get_current_user, token_cache
+from app.embedding_batcher import query_batcher
+from app.cache import cache_stats
+from app.middlewares.chat_ownership import chat_owner_cache
+from app.embedding_store import embedding_store_stats
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/")
+def get_metrics():
+    """
+    Runtime counters for tuning batching and caching
+    """
+    return {
+        "query_embedding_batcher": query_batcher.stats(),
+        "caches": {
+            **cache_stats(),
+            "auth_tokens": token_cache.stats(),
+            "chat_owners": chat_owner_cache.stats(),
+            "chunk_embeddings": embedding_store_stats(),
+        },
+    }
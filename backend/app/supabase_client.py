@@ -1,4 +1,5 @@
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client, AsyncClient
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -7,7 +8,18 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Sync client for ingestion workers and other code running off the event loop
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
-def get_supabase() -> Client:
-    return supabase
+
+# Async client for request handlers; acreate_client is a coroutine, so it is built on first use
+_async_supabase: AsyncClient = None
+_async_supabase_lock = asyncio.Lock()
+
+async def get_async_supabase() -> AsyncClient:
+    global _async_supabase
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _async_supabase
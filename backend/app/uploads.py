@@ -0,0 +1,101 @@
+# uploads.py
+"""
+Uploaded documents are spooled exactly once, into memory when small and into a
+temporary file otherwise. The parser, the PDF workers and the storage uploader all
+read from that one copy: in-memory readers share the bytes, and on-disk readers open
+the file themselves, so the document is never loaded into memory just to be passed on.
+"""
+import io
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Uploads up to this size stay in memory; larger ones go to UPLOAD_SPOOL_DIR
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", str(8 * 1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+UPLOAD_READ_CHUNK = 1024 * 1024
+
+
+class UploadBuffer:
+    """
+    One spooled upload. Exactly one of `data` (in memory) or `path` (on disk) is set.
+    Picklable, so it can be handed to a process-pool worker as-is.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, path: Optional[str] = None, size: int = 0):
+        self.data = data
+        self.path = path
+        self.size = size
+
+    def open(self):
+        """A new independent binary reader positioned at the start."""
+        if self.path is not None:
+            return open(self.path, "rb")
+        return io.BytesIO(self.data)  # shares the bytes until written to
+
+    @contextmanager
+    def storage_body(self):
+        """What the storage client should send: the bytes, or a reader it streams from."""
+        if self.path is None:
+            yield self.data
+        else:
+            # The storage client doesn't close what it's given
+            with open(self.path, "rb") as body:
+                yield body
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.data = None
+
+
+async def spool_upload(file: UploadFile) -> UploadBuffer:
+    """
+    Copy the request's upload into an UploadBuffer and release the request's own copy.
+    """
+    parts, size, spool = [], 0, None
+
+    try:
+        while True:
+            part = await file.read(UPLOAD_READ_CHUNK)
+            if not part:
+                break
+            size += len(part)
+
+            if spool is None and size > UPLOAD_MEMORY_LIMIT:
+                spool = tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_SPOOL_DIR, delete=False)
+                await run_in_threadpool(spool.writelines, parts)
+                parts = []
+
+            if spool is None:
+                parts.append(part)
+            else:
+                await run_in_threadpool(spool.write, part)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    finally:
+        await file.close()
+
+    if spool is None:
+        return UploadBuffer(data=b"".join(parts), size=size)
+
+    spool.close()
+    logger.info(f"Spooled {size} byte upload to {spool.name}")
+    return UploadBuffer(path=spool.name, size=size)
@@ -1,60 +1,116 @@
-import pandas as pd
-from PyPDF2 import PdfReader
+from app.pdf_extraction import iter_pdf_pages
 import io
-from app.supabase_client import supabase
-from app.qdrant_client import qdrant
+from app.supabase_client import supabase, get_async_supabase
+from app.qdrant_client import async_qdrant
 from app.qdrant_client import COLLECTION_NAME
+from app.cache import invalidate_chat
 import uuid
 from qdrant_client import models
-from typing import Optional
-import time
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+import asyncio
+import os
 
+from dotenv import load_dotenv
 
-def chunk_text(text: str, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    return chunks
+load_dotenv()
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-async def read_file_content(file):
-    filename = file.filename.lower()
+# Rows per CSV read and per row-group page handed to the chunker
+TABLE_CHUNK_ROWS = int(os.getenv("TABLE_CHUNK_ROWS", "5000"))
 
-    if filename.endswith(".pdf"):
-        reader = PdfReader(file.file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
 
-    elif filename.endswith(".txt"):
-        content = await file.read()
-        return content.decode("utf-8")
+def iter_chunks(pages: Iterable[str], chunk_size=500, overlap=50) -> Iterator[str]:
+    """
+    Turn a stream of page texts into overlapping word-window chunks.
+    Only the words of the chunk being built are held in memory, never the whole document.
+    """
+    step = chunk_size - overlap
+    window = []
+    emitted = False
+
+    for page in pages:
+        window.extend(page.split())
+        while len(window) >= chunk_size:
+            yield " ".join(window[:chunk_size])
+            emitted = True
+            del window[:step]
+
+    # Skip a trailing window that is nothing but the previous chunk's overlap
+    if window and (not emitted or len(window) > overlap):
+        yield " ".join(window)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_file_pages(filename: str, fileobj) -> Iterator[str]:
+    """
+    Yield a document's text one page (PDF), line (TXT) or table (CSV/XLSX) at a time.
+    Unsupported file types raise ValueError immediately rather than on first iteration.
+    """
+    filename = filename.lower()
 
+    if filename.endswith(".pdf"):
+        return iter_pdf_pages(fileobj)
+    elif filename.endswith(".txt"):
+        return _iter_text_lines(fileobj)
     elif filename.endswith(".csv"):
-        file.file.seek(0)
-        decoded = file.file.read().decode("utf-8")
-        df = pd.read_csv(io.StringIO(decoded))
-        return _convert_dataframe_to_text(df)
-
+        return _iter_csv_text(fileobj)
     elif filename.endswith(".xlsx"):
-        file.file.seek(0)
-        df = pd.read_excel(file.file)
-        return _convert_dataframe_to_text(df)
+        return _iter_xlsx_text(fileobj)
     else:
         raise ValueError("Only PDF, TXT, CSV, and XLSX files are supported.")
 
 
+def _iter_text_lines(fileobj) -> Iterator[str]:
+    reader = io.TextIOWrapper(fileobj, encoding="utf-8")
+    try:
+        yield from reader
+    finally:
+        reader.detach()  # leave the caller's file object open
+
+
+def _iter_csv_text(fileobj, chunk_rows: int = TABLE_CHUNK_ROWS) -> Iterator[str]:
+    """Read the CSV chunk_rows rows at a time and yield each row group as text."""
+    import pandas as pd  # only needed for spreadsheets, and slow to import
 
+    fileobj.seek(0)
+    # The chunk index carries on across reads, so row numbers stay document-wide
+    with pd.read_csv(fileobj, encoding="utf-8", chunksize=chunk_rows) as reader:
+        for df in reader:
+            yield _convert_dataframe_to_text(df)
 
-async def upload_to_supabase_storage(file, chat_id: str) -> str:
-    filename = f"{chat_id}/{uuid.uuid4()}_{file.filename}"
-    content = await file.read()
+
+def _iter_xlsx_text(fileobj, chunk_rows: int = TABLE_CHUNK_ROWS) -> Iterator[str]:
+    import pandas as pd
+
+    fileobj.seek(0)
+    df = pd.read_excel(fileobj)
+    for start in range(0, len(df), chunk_rows):
+        yield _convert_dataframe_to_text(df.iloc[start:start + chunk_rows])
+
+
+
+
+def upload_to_supabase_storage(content, original_filename: str, content_type: str, chat_id: str) -> str:
+    """
+    `content` is bytes or an open binary file, which is streamed; the caller closes it.
+    """
+    filename = f"{chat_id}/{uuid.uuid4()}_{original_filename}"
 
     try:
-        supabase.storage.from_("documents").upload(filename, content, file_options={"content-type": file.content_type})
+        supabase.storage.from_("documents").upload(filename, content, file_options={"content-type": content_type})
     except Exception as e:
         raise Exception(f"Supabase upload failed: {str(e)}")
 
@@ -63,12 +119,24 @@ async def upload_to_supabase_storage(file, chat_id: str) -> str:
 
 
 
-def _convert_dataframe_to_text(df: pd.DataFrame):
-    rows = []
-    for i, row in df.iterrows():
-        sentence = ", ".join(f"{col}: {val}" for col, val in row.items())
-        rows.append(f"Row {i + 1}: {sentence}")
-    return "\n".join(rows)
+def _convert_dataframe_to_text(df: "pd.DataFrame") -> str:
+    """
+    One "Row n: col: value, ..." line per row, numbered from the (RangeIndex) index.
+    Built column by column rather than row by row, with the same cell text iterrows gave.
+    """
+    import pandas as pd
+
+    if df.empty:
+        return ""
+
+    # Rebuilt from the interleaved values so cells take the dtype iterrows gave them
+    # (ints beside floats print as floats); str() keeps missing cells as nan/NaT/None
+    values = pd.DataFrame(df.to_numpy(), index=df.index)
+    rows = "Row " + pd.Series(df.index + 1, index=df.index).astype(str) + ": "
+    if len(df.columns):
+        cells = [f"{col}: " + values.iloc[:, i].map(str) for i, col in enumerate(df.columns)]
+        rows = rows + cells[0].str.cat(cells[1:], sep=", ")
+    return "\n".join(rows.tolist())
 
 
 
@@ -97,7 +165,7 @@ def extract_filename_from_url(file_url: str) -> Optional[str]:
         return None
 
 
-def delete_file_and_chunks(file_url: str, chat_id: str):
+async def delete_file_and_chunks(file_url: str, chat_id: str):
     """
     Delete file from Supabase Storage and associated chunks from Qdrant
     
@@ -121,7 +189,8 @@ def delete_file_and_chunks(file_url: str, chat_id: str):
         try:
             filename = extract_filename_from_url(file_url)
             if filename:
-                supabase.storage.from_("documents").remove([filename])
+                async_supabase = await get_async_supabase()
+                await async_supabase.storage.from_("documents").remove([filename])
                 results["file_deleted"] = True
 
             else:
@@ -135,8 +204,8 @@ def delete_file_and_chunks(file_url: str, chat_id: str):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            qdrant.delete(
-                collection_name="text_chunks",
+            await async_qdrant.delete(
+                collection_name=COLLECTION_NAME,
                 points_selector=models.FilterSelector(
                     filter=models.Filter(
                         must=[
@@ -149,6 +218,7 @@ def delete_file_and_chunks(file_url: str, chat_id: str):
                 )
             )
             results["chunks_deleted"] = True
+            invalidate_chat(chat_id)
 
             break
         except Exception as e:
@@ -158,6 +228,6 @@ def delete_file_and_chunks(file_url: str, chat_id: str):
 
             else:
 
-                time.sleep(1)  # Wait 1 second before retry
+                await asyncio.sleep(1)  # Wait 1 second before retry
     
     return results
@@ -0,0 +1,109 @@
+# vector_writer.py
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from app.qdrant_client import qdrant, COLLECTION_NAME
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Batches uploading at once per document
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "2"))
+UPSERT_MAX_RETRIES = 3
+
+
+class QdrantBulkWriter:
+    """
+    Uploads a document's batches in the background so the next batch can be embedded
+    while the previous one is in flight.
+
+    Each batch is retried on its own. Batches are sent with wait=False, except the
+    last one, which is held back until close() and sent with wait=True once every
+    earlier batch has been accepted. Qdrant applies updates in order, so when close()
+    returns, every point is searchable.
+
+    At most `parallel * 2` batches are pending; write() blocks beyond that, which
+    keeps memory bounded when embedding outpaces the uploads.
+    """
+
+    def __init__(self, collection_name: str = COLLECTION_NAME, parallel: int = QDRANT_UPLOAD_PARALLEL,
+                 max_retries: int = UPSERT_MAX_RETRIES):
+        self.collection_name = collection_name
+        self.max_retries = max_retries
+        self.max_pending = max(1, parallel) * 2
+        self._executor = ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix="qdrant-writer")
+        self._pending = deque()
+        self._held = None
+        self.points_written = 0
+
+    def write(self, ids, vectors, payloads):
+        """
+        Queue one batch. Raises the error of an earlier batch that exhausted its retries.
+        """
+        if self._held is not None:
+            self._submit(*self._held, wait=False)
+        self._held = (ids, vectors, payloads)
+
+        while len(self._pending) >= self.max_pending:
+            self._collect(self._pending.popleft())
+
+    def close(self):
+        """Send the held-back batch with wait=True once the rest are in; raises on failure."""
+        try:
+            while self._pending:
+                self._collect(self._pending.popleft())
+            if self._held is not None:
+                held, self._held = self._held, None
+                self._upsert(*held, wait=True)
+                self.points_written += len(held[0])
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """Drop queued batches and wait for the ones already uploading, so cleanup can't race them."""
+        self._held = None
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, ids, vectors, payloads, wait: bool):
+        future = self._executor.submit(self._upsert, ids, vectors, payloads, wait)
+        future.batch_size = len(ids)
+        self._pending.append(future)
+
+    def _collect(self, future):
+        future.result()
+        self.points_written += future.batch_size
+
+    def _upsert(self, ids, vectors, payloads, wait: bool):
+        retry_delay = 1  # seconds
+
+        for attempt in range(self.max_retries):
+            try:
+                # upload_collection takes the NumPy matrix as-is, no per-float Python lists
+                qdrant.upload_collection(
+                    collection_name=self.collection_name,
+                    vectors=vectors,
+                    payload=payloads,
+                    ids=ids,
+                    batch_size=len(ids),
+                    max_retries=1,  # retries are handled here, with backoff
+                    wait=wait,
+                )
+                return
+
+            except Exception as e:
+                if attempt == self.max_retries - 1:  # Last attempt failed
+                    logger.error(f"❌ Qdrant upload of {len(ids)} points failed after {self.max_retries} attempts: {e}")
+                    raise
+                logger.warning(f"⚠️ Qdrant upload attempt {attempt + 1} failed: {e}")
+                logger.info(f"Retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)  # Fine here: we are on a writer thread, not the event loop
+                retry_delay *= 2  # Exponential backoff
@@ -0,0 +1,113 @@
+"""
+Cold-start benchmark for the backend.
+
+Measures, in fresh interpreters:
+  * import time of app.main (and whether torch / pandas / PyPDF2 got imported with it)
+  * time from launching uvicorn until GET / answers (serving)
+  * time from launching uvicorn until GET /ready answers 200 (embedding model warm)
+
+Run from backend/ with the usual .env in place:
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+heavy = [name for name in ("torch", "sentence_transformers", "pandas", "PyPDF2", "google.generativeai") if name in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy_modules": heavy}))
+"""
+
+
+def measure_import() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _status(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def measure_server(timeout: float) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    serving = ready = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if serving is None and _status(f"{base}/") == 200:
+                serving = time.perf_counter() - started
+            if serving is not None and _status(f"{base}/ready") == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {"serving": serving, "ready": ready}
+
+
+def _summary(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "n/a"
+    return f"median {statistics.median(values):.2f}s  min {min(values):.2f}s  max {max(values):.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for /ready per run")
+    args = parser.parse_args()
+
+    imports, serving, ready = [], [], []
+    for run in range(1, args.runs + 1):
+        probe = measure_import()
+        server = measure_server(args.timeout)
+        imports.append(probe["seconds"])
+        serving.append(server["serving"])
+        ready.append(server["ready"])
+        print(
+            f"run {run}: import {probe['seconds']:.2f}s, serving {server['serving']}, ready {server['ready']}, "
+            f"heavy modules at import: {', '.join(probe['heavy_modules']) or 'none'}"
+        )
+
+    print(f"import app.main   {_summary(imports)}")
+    print(f"serving (GET /)   {_summary(serving)}")
+    print(f"ready (GET /ready) {_summary(ready)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+-- Rolling conversation summary kept by app/history.py.
+-- Run once in the Supabase SQL editor (or with `supabase db push`); safe to re-run.
+
+alter table public.chats add column if not exists history_summary text;
+
+-- history_summary_until holds a messages.created_at value and is compared with them,
+-- so it takes exactly the type that column has in this project.
+do $$
+declare
+    created_at_type text;
+begin
+    select format_type(atttypid, atttypmod) into created_at_type
+    from pg_attribute
+    where attrelid = 'public.messages'::regclass and attname = 'created_at';
+
+    execute format('alter table public.chats add column if not exists history_summary_until %s', created_at_type);
+end
+$$;
@@ -0,0 +1,33 @@
+import os
+import sys
+
+# Clients are created at import time; give them harmless settings before any app import
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.test")
+os.environ.setdefault("QDRANT_URL", "http://localhost:6333")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("EMBED_CACHE_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def api():
+    """TestClient for the app with auth and the embedding readiness gate overridden."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.middlewares.auth_middleware import get_current_user
+    from app.middlewares.readiness import require_embedding_model
+    from app.supabase_client import get_async_supabase
+
+    user = {"user_id": "user-1"}
+    app.dependency_overrides[get_current_user] = lambda: dict(user)
+    app.dependency_overrides[require_embedding_model] = lambda: None
+    app.dependency_overrides[get_async_supabase] = lambda: None
+
+    client = TestClient(app)
+    client.user = user  # tests switch users by mutating this
+    yield client
+    app.dependency_overrides.clear()
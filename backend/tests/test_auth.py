@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import app.middlewares.auth_middleware as auth
+from app.cache import TTLCache
+
+SECRET = "test-secret-with-enough-bytes-for-hs256"
+
+
+class RecordingCache(TTLCache):
+    def __init__(self):
+        super().__init__(maxsize=100, ttl=auth.TOKEN_CACHE_TTL)
+        self.ttls = []
+
+    def set(self, key, value, ttl=None):
+        self.ttls.append(ttl)
+        super().set(key, value, ttl=ttl)
+
+
+@pytest.fixture
+def local_auth(monkeypatch):
+    """HS256 local verification with a fresh token cache and a recorded remote check."""
+    monkeypatch.setattr(auth, "AUTH_VERIFY_MODE", "local")
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", False)
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth, "token_cache", RecordingCache())
+
+    remote_calls = []
+
+    async def verify_remotely(token, supabase):
+        remote_calls.append(token)
+        return {"user_id": "remote-user"}
+
+    monkeypatch.setattr(auth, "_verify_remotely", verify_remotely)
+    return remote_calls
+
+
+def make_token(secret=SECRET, expires_in=3600, audience="authenticated", sub="user-1"):
+    claims = {"sub": sub, "aud": audience, "exp": int(time.time()) + expires_in, "email": "a@example.com"}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def current_user(token):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return asyncio.run(auth.get_current_user(credentials, supabase=None))
+
+
+def test_valid_token_is_accepted_and_cached(local_auth, monkeypatch):
+    token = make_token()
+    user = current_user(token)
+    assert user["user_id"] == "user-1"
+    assert user["email"] == "a@example.com"
+
+    # A cache hit doesn't verify the token again
+    monkeypatch.setattr(auth, "_verify_locally", None)
+    assert current_user(token) is user
+    assert local_auth == []
+
+
+def test_expired_token_is_rejected_without_remote_fallback(local_auth, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", True)
+
+    with pytest.raises(HTTPException) as exc:
+        current_user(make_token(expires_in=-60))
+
+    assert exc.value.status_code == 401
+    assert exc.value.detail == "Authentication token expired"
+    assert local_auth == []
+
+
+@pytest.mark.parametrize("token", [
+    make_token(audience="someone-else"),
+    make_token(secret="a-different-secret-of-enough-length"),
+])
+def test_wrong_audience_or_signature_is_rejected(local_auth, token):
+    with pytest.raises(HTTPException) as exc:
+        current_user(token)
+
+    assert exc.value.status_code == 401
+    assert exc.value.detail == "Invalid authentication token"
+    assert local_auth == []
+
+
+def test_remote_fallback_checks_tokens_local_verification_rejects(local_auth, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", True)
+    token = make_token(secret="a-different-secret-of-enough-length")
+
+    assert current_user(token) == {"user_id": "remote-user"}
+    assert local_auth == [token]
+    assert auth.token_cache.ttls == [auth.TOKEN_CACHE_TTL]
+
+
+def test_cache_entry_does_not_outlive_the_token(local_auth):
+    current_user(make_token(expires_in=30))
+    current_user(make_token(expires_in=3600, sub="user-2"))
+
+    short, long = auth.token_cache.ttls
+    assert 0 < short <= 30
+    assert long == auth.TOKEN_CACHE_TTL
@@ -0,0 +1,53 @@
+from app.chunking import Chunk, TokenChunker
+
+
+def count_words(texts):
+    """One token per word keeps the expected chunk sizes easy to read."""
+    return [len(text.split()) for text in texts]
+
+
+def _text_at(pages, chunk):
+    return "".join(pages)[chunk.char_start:chunk.char_end]
+
+
+def test_whole_paragraphs_are_packed_up_to_the_limit():
+    pages = ["one two three\n\nfour five\n\nsix seven eight nine"]
+    chunks = list(TokenChunker(count_words, max_tokens=5).chunk(pages))
+
+    assert [c.text for c in chunks] == ["one two three\nfour five", "six seven eight nine"]
+    assert all(tokens <= 5 for tokens in count_words([c.text for c in chunks]))
+
+
+def test_long_paragraphs_split_at_sentences_then_words():
+    pages = ["Short one. " + " ".join(f"w{i}" for i in range(7)) + "."]
+    chunks = list(TokenChunker(count_words, max_tokens=3).chunk(pages))
+
+    assert [c.text for c in chunks] == ["Short one.", "w0 w1 w2", "w3 w4 w5", "w6."]
+
+
+def test_offsets_and_pages_point_back_into_the_text():
+    pages = ["alpha beta\n\ngamma delta", "epsilon zeta"]
+    chunks = list(TokenChunker(count_words, max_tokens=2).chunk(pages))
+
+    assert [c.page for c in chunks] == [1, 1, 2]
+    # A chunk holds its units joined by newlines; the offsets cover them in the source
+    assert [_text_at(pages, c) for c in chunks] == ["alpha beta", "gamma delta", "epsilon zeta"]
+
+
+def test_unpaged_documents_have_no_page_numbers():
+    chunks = list(TokenChunker(count_words, max_tokens=2).chunk(["a b\n\nc d"], paged=False))
+
+    assert [c.page for c in chunks] == [None, None]
+    assert "page" not in chunks[0].payload()
+
+
+def test_trailing_units_overlap_into_the_next_chunk():
+    pages = ["One. Two. Three. Four. Five."]
+    chunks = list(TokenChunker(count_words, max_tokens=3, overlap_tokens=1).chunk(pages))
+
+    assert [c.text for c in chunks] == ["One.\nTwo.\nThree.", "Three.\nFour.\nFive."]
+
+
+def test_payload_only_carries_known_locations():
+    assert Chunk("text", page=2, char_start=0, char_end=4).payload() == {"page": 2, "char_start": 0, "char_end": 4}
+    assert Chunk("text").payload() == {}
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+from app.context import drop_near_duplicates, merge_adjacent, pack_context, Passage
+from app.tokens import estimate_tokens
+
+
+def hit(text, score, chunk_index=None, doc_id=None, point_id=None):
+    payload = {"text": text}
+    if chunk_index is not None:
+        payload["chunk_index"] = chunk_index
+    if doc_id is not None:
+        payload["doc_id"] = doc_id
+    return SimpleNamespace(id=point_id or f"{doc_id}/{chunk_index}/{text}", payload=payload, score=score)
+
+
+def words(start, stop):
+    return " ".join(f"w{i}" for i in range(start, stop))
+
+
+def test_consecutive_chunks_merge_without_repeating_the_overlap():
+    first = hit(words(0, 10), 0.9, 0)
+    passages = merge_adjacent([hit(words(5, 15), 0.4, 1), first, first])
+
+    assert passages == [Passage(words(0, 15), 0.9, 0)]
+
+
+def test_documents_sharing_indexes_are_not_merged_or_dropped():
+    hits = [
+        hit("first doc opening", 0.9, 0, doc_id="a"),
+        hit("second doc opening", 0.8, 0, doc_id="b"),
+        hit("second doc follow-up", 0.7, 1, doc_id="b"),
+        hit("first doc page two", 0.6, 2, doc_id="a"),
+    ]
+
+    assert merge_adjacent(hits) == [
+        Passage("first doc opening", 0.9, 0, "a"),
+        Passage("first doc page two", 0.6, 2, "a"),
+        Passage("second doc opening second doc follow-up", 0.8, 0, "b"),
+    ]
+
+
+def test_distinct_points_at_the_same_position_are_kept():
+    hits = [hit("old wording", 0.9, 3, point_id="p1"), hit("new wording", 0.8, 3, point_id="p2")]
+
+    assert [p.text for p in merge_adjacent(hits)] == ["old wording", "new wording"]
+
+
+def test_gaps_and_legacy_points_stay_separate():
+    passages = merge_adjacent([hit("chunk three", 0.5, 3), hit("chunk one", 0.6, 1), hit("legacy text", 0.7)])
+
+    assert passages == [
+        Passage("legacy text", 0.7, None),
+        Passage("chunk one", 0.6, 1),
+        Passage("chunk three", 0.5, 3),
+    ]
+
+
+def test_near_duplicates_keep_the_best_scoring_copy():
+    text = words(0, 40)
+    passages = [Passage(text, 0.3, 1), Passage(text + " extra", 0.8, 7), Passage(words(100, 140), 0.5, 2)]
+
+    assert drop_near_duplicates(passages) == [Passage(text + " extra", 0.8, 7), Passage(words(100, 140), 0.5, 2)]
+
+
+def test_budget_is_spent_on_the_most_relevant_passages():
+    best, second, third = words(0, 100), words(200, 300), words(400, 500)
+    hits = [hit(third, 0.1, 20), hit(best, 0.9, 0), hit(second, 0.5, 10)]
+    budget = estimate_tokens(best) + estimate_tokens(second) + 10
+
+    context = pack_context(hits, budget=budget, order="relevance")
+
+    # The third passage would be cut below MIN_PASSAGE_TOKENS, so it is left out
+    assert context == f"{best}\n\n{second}"
+    assert estimate_tokens(context) <= budget
+
+
+def test_last_passage_is_truncated_to_fit():
+    best, second = words(0, 100), words(200, 300)
+    budget = estimate_tokens(best) + 60
+
+    context = pack_context([hit(best, 0.9, 0), hit(second, 0.5, 10)], budget=budget)
+
+    first, cut = context.split("\n\n")
+    assert first == best
+    assert cut.startswith("w200 w201") and cut.endswith(" …")
+    assert estimate_tokens(cut) <= 61  # the ellipsis may round up one token
+
+
+def test_position_order_follows_the_document():
+    hits = [hit("late passage", 0.9, 30), hit("legacy passage", 0.8), hit("early passage", 0.1, 2)]
+
+    assert pack_context(hits, order="position") == "early passage\n\nlate passage\n\nlegacy passage"
+    assert pack_context(hits, order="relevance") == "late passage\n\nlegacy passage\n\nearly passage"
+
+    # Positions are only comparable within a document
+    hits = [hit("b start", 0.9, 0, doc_id="b"), hit("a end", 0.8, 9, doc_id="a"), hit("a start", 0.7, 0, doc_id="a")]
+    assert pack_context(hits, order="position") == "a start\n\na end\n\nb start"
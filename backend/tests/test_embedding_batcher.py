@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import app.embedding_batcher as embedding_batcher
+from app.embedding_batcher import QueryEmbeddingBatcher
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+    """embed_texts stand-in: vector = [len(text)], with an optional gate to hold a batch."""
+    gate = threading.Event()
+    gate.set()
+    batches = []
+
+    def embed(texts):
+        gate.wait(5)
+        batches.append(list(texts))
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(embedding_batcher, "embed_texts", embed)
+    embed.gate = gate
+    embed.batches = batches
+    return embed
+
+
+def test_concurrent_requests_share_a_batch(fake_embed):
+    batcher = QueryEmbeddingBatcher(max_wait_ms=50, max_batch_size=8)
+    futures = [batcher.submit("x" * n) for n in range(1, 5)]
+
+    assert [f.result(timeout=5)[0] for f in futures] == [1.0, 2.0, 3.0, 4.0]
+    assert len(fake_embed.batches) == 1
+    assert batcher.stats()["requests"] == 4
+
+
+def test_embedding_failure_reaches_every_caller(monkeypatch):
+    def broken(texts):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(embedding_batcher, "embed_texts", broken)
+    batcher = QueryEmbeddingBatcher(max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        batcher.encode("hello")
+
+
+def test_cancelled_caller_does_not_stop_the_batcher(fake_embed):
+    batcher = QueryEmbeddingBatcher(max_wait_ms=1)
+
+    async def scenario():
+        # Hold the first batch in the model so the second request is cancelled while queued
+        fake_embed.gate.clear()
+        blocker = asyncio.ensure_future(batcher.aencode("first"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(batcher.aencode("cancelled"), 0.05)
+        fake_embed.gate.set()
+        await blocker
+
+        # The cancelled request was dropped and the thread is still serving
+        return await asyncio.wait_for(batcher.aencode("after"), 5)
+
+    assert asyncio.run(scenario())[0] == 5.0
+    assert ["cancelled"] not in fake_embed.batches
+
+
+def test_caller_cancelled_during_encode_does_not_stop_the_batcher(fake_embed):
+    batcher = QueryEmbeddingBatcher(max_wait_ms=1)
+
+    async def scenario():
+        fake_embed.gate.clear()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(batcher.aencode("cancelled"), 0.05)
+        fake_embed.gate.set()
+        return await asyncio.wait_for(batcher.aencode("after"), 5)
+
+    assert asyncio.run(scenario())[0] == 5.0
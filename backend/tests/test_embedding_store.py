@@ -0,0 +1,91 @@
+import numpy as np
+
+import app.embedding_store as embedding_store
+from app.embedding_store import EmbeddingStore, content_key, embed_texts_cached
+
+
+def _vec(value, dim=4):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def _fill(store, keys):
+    out = np.zeros((len(keys), store.dim), dtype=np.float32)
+    missing = store.fill(keys, out)
+    return out, missing
+
+
+def test_put_then_fill_round_trip(tmp_path):
+    store = EmbeddingStore(str(tmp_path), capacity=4, dim=4)
+    store.put([b"a" * 32, b"b" * 32], np.stack([_vec(1), _vec(2)]))
+
+    out, missing = _fill(store, [b"b" * 32, b"c" * 32, b"a" * 32])
+
+    assert missing == [1]
+    assert out[0][0] == 2 and out[2][0] == 1
+    assert store.stats()["hits"] == 2 and store.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    store = EmbeddingStore(str(tmp_path), capacity=2, dim=4)
+    store.put([b"a" * 32, b"b" * 32], np.stack([_vec(1), _vec(2)]))
+    _fill(store, [b"a" * 32])  # b is now the oldest
+    store.put([b"c" * 32], np.stack([_vec(3)]))
+
+    _, missing = _fill(store, [b"a" * 32, b"b" * 32, b"c" * 32])
+    assert missing == [1]
+    assert store.stats()["evictions"] == 1
+
+
+def test_entries_survive_reopening(tmp_path):
+    EmbeddingStore(str(tmp_path), capacity=4, dim=4).put([b"a" * 32], np.stack([_vec(7)]))
+
+    out, missing = _fill(EmbeddingStore(str(tmp_path), capacity=4, dim=4), [b"a" * 32])
+    assert missing == [] and out[0][0] == 7
+
+
+def test_slot_reused_by_another_process_is_a_miss_not_a_wrong_vector(tmp_path):
+    first = EmbeddingStore(str(tmp_path), capacity=1, dim=4)
+    first.put([b"a" * 32], np.stack([_vec(1)]))
+
+    # A second process opens the same files and evicts "a" for "b"
+    second = EmbeddingStore(str(tmp_path), capacity=1, dim=4)
+    second.put([b"b" * 32], np.stack([_vec(2)]))
+
+    out, missing = _fill(first, [b"a" * 32])
+    assert missing == [0]
+    assert out[0][0] == 0
+
+
+def test_different_configuration_does_not_touch_existing_files(tmp_path):
+    small = EmbeddingStore(str(tmp_path), capacity=2, dim=4)
+    small.put([b"a" * 32], np.stack([_vec(1)]))
+
+    EmbeddingStore(str(tmp_path), capacity=8, dim=4)
+
+    out, missing = _fill(small, [b"a" * 32])
+    assert missing == [] and out[0][0] == 1
+
+
+def test_embed_texts_cached_only_embeds_unseen_text(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path), capacity=8, dim=4)
+    embedded = []
+
+    def fake_embed(texts):
+        embedded.extend(texts)
+        return np.stack([_vec(len(t)) for t in texts])
+
+    monkeypatch.setattr(embedding_store, "get_embedding_store", lambda: store)
+    monkeypatch.setattr(embedding_store, "embed_texts", fake_embed)
+
+    first = embed_texts_cached(["one", "three"])
+    second = embed_texts_cached(["three", "fours", "one"])
+
+    assert embedded == ["one", "three", "fours"]
+    assert second[0][0] == 5 and second[1][0] == 5 and second[2][0] == 3
+    np.testing.assert_array_equal(first[1], second[0])
+
+
+def test_content_key_depends_on_the_model(monkeypatch):
+    key = content_key("text")
+    monkeypatch.setattr(embedding_store, "EMBEDDING_MODEL_NAME", "another-model")
+    assert content_key("text") != key
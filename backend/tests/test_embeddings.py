@@ -0,0 +1,89 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+from fastapi import HTTPException
+
+import app.embeddings as embeddings
+from app.middlewares.readiness import require_embedding_model
+
+
+class FakeModel:
+    load_failures = 0  # constructions that raise, like a failed download
+
+    def __init__(self, name, device=None):
+        if FakeModel.load_failures:
+            FakeModel.load_failures -= 1
+            raise OSError("model download failed")
+        self.encoded = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+
+    def encode(self, texts, **kwargs):
+        self.encoded.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("encode failed")
+        return [[0.0] for _ in texts]
+
+
+@pytest.fixture
+def fresh_model(monkeypatch):
+    """Unloaded embedding model backed by FakeModel instead of sentence-transformers."""
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeModel
+    monkeypatch.setattr(FakeModel, "load_failures", 0)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    monkeypatch.setattr(embeddings, "_model", None)
+    monkeypatch.setattr(embeddings, "_model_state", {"status": "not_loaded", "error": None, "load_seconds": None})
+
+
+def test_loaded_model_is_not_ready_until_warm_up_encodes(fresh_model):
+    model = embeddings.get_model()
+    assert embeddings.model_status()["status"] == "loaded"
+    assert not embeddings.model_ready()
+
+    # Still warming up: the gate keeps answering 503
+    model.release.clear()
+    thread = threading.Thread(target=embeddings.warm_up)
+    thread.start()
+    assert model.encoded.wait(5)
+    with pytest.raises(HTTPException) as exc:
+        require_embedding_model()
+    assert exc.value.status_code == 503
+
+    model.release.set()
+    thread.join(5)
+    assert embeddings.model_ready()
+    require_embedding_model()
+
+
+def test_failed_warm_up_encode_is_reported_and_retried(fresh_model):
+    model = embeddings.get_model()
+    model.fail = True
+    thread = threading.Thread(target=embeddings.warm_up, kwargs={"retry_seconds": 0.01}, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while embeddings.model_status()["status"] != "failed" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(HTTPException) as exc:
+        require_embedding_model()
+    assert exc.value.detail == "The embedding model failed to load."
+
+    # The next attempt succeeds without a restart
+    model.fail = False
+    thread.join(5)
+    assert embeddings.model_ready()
+    assert embeddings.model_status()["error"] is None
+
+
+def test_failed_model_load_is_retried(fresh_model):
+    FakeModel.load_failures = 2
+    embeddings.warm_up(retry_seconds=0.01)
+
+    assert FakeModel.load_failures == 0
+    assert embeddings.model_ready()
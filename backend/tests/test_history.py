@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+import app.history as history
+from app.history import build_history_context, select_window
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+
+    def __getattr__(self, name):
+        # select / eq / order / limit / lt / gt just chain
+        return lambda *args, **kwargs: self
+
+    def update(self, values):
+        self.db.updates.append((self.table, values))
+        return self
+
+    async def execute(self):
+        result = self.db.results[self.table]
+        if isinstance(result, Exception):
+            raise result
+        return type("Result", (), {"data": result})()
+
+
+class FakeSupabase:
+    def __init__(self, results):
+        self.results = results
+        self.updates = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def agenerate(self, prompt):
+        self.calls += 1
+        return "The user asked about pricing."
+
+
+def _messages(count, words=300):
+    # Newest first, as the history query returns them
+    return [
+        {"id": str(i), "role": "user" if i % 2 else "assistant",
+         "content": " ".join(["word"] * words), "created_at": f"2024-01-01T00:{i:02d}:00"}
+        for i in reversed(range(count))
+    ]
+
+
+@pytest.fixture
+def env(monkeypatch):
+    llm = CountingLLM()
+    monkeypatch.setattr(history, "get_llm", lambda: llm)
+    monkeypatch.setattr(history, "_summary_unavailable_until", 0.0)
+
+    def use(db):
+        async def get_db():
+            return db
+        monkeypatch.setattr(history, "get_async_supabase", get_db)
+
+    return llm, use
+
+
+async def _build_and_settle(chat_id):
+    context = await build_history_context(chat_id)
+    if history._summary_tasks:
+        await asyncio.gather(*history._summary_tasks)
+    return context
+
+
+def test_window_keeps_newest_turns_within_budget():
+    messages = _messages(5, words=100)
+    window, overflow = select_window(messages, budget=400)
+
+    assert [m["id"] for m in window] == ["2", "3", "4"]  # oldest first
+    assert [m["id"] for m in overflow] == ["1", "0"]
+
+
+def test_a_single_oversized_turn_is_truncated_not_dropped():
+    window, overflow = select_window(_messages(1, words=2000), budget=100)
+    assert len(window) == 1 and len(window[0]["content"]) < 2000 * 5
+
+
+def test_overflow_is_summarized_and_stored(env):
+    llm, use = env
+    db = FakeSupabase({"messages": _messages(20), "chats": [{"history_summary": None, "history_summary_until": None}]})
+    use(db)
+
+    asyncio.run(_build_and_settle("chat-1"))
+
+    assert llm.calls == 1
+    (table, values), = db.updates
+    assert table == "chats"
+    assert values["history_summary"] == "The user asked about pricing."
+
+
+def test_missing_summary_columns_skip_summarization(env):
+    llm, use = env
+    db = FakeSupabase({"messages": _messages(20), "chats": Exception("column chats.history_summary does not exist")})
+    use(db)
+
+    first = asyncio.run(_build_and_settle("chat-1"))
+    second = asyncio.run(_build_and_settle("chat-1"))
+
+    assert llm.calls == 0
+    assert db.updates == []
+    assert first == second
+    assert "Summary of earlier conversation" not in first
@@ -0,0 +1,209 @@
+import uuid
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+import app.ingestion as ingestion
+import app.vector_writer as vector_writer
+from app.chunking import TokenChunker
+from app.ingestion import IngestionError, ingest_document
+from app.qdrant_client import COLLECTION_NAME
+from app.uploads import UploadBuffer
+
+DIM = 4
+STORAGE_URL = "https://project.supabase.co/storage/v1/object/public/documents/"
+
+
+class FakeSupabase:
+    """The chats row and storage bucket ingestion touches."""
+
+    def __init__(self):
+        self.file_url = None
+        self.removed = []
+        self._update = None
+
+    def table(self, name):
+        return self
+
+    def select(self, *columns):
+        self._update = None
+        return self
+
+    def update(self, values):
+        self._update = values
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        if self._update is not None:
+            self.file_url = self._update["file_url"]
+            return type("Res", (), {"data": [self._update]})()
+        return type("Res", (), {"data": [{"file_url": self.file_url}]})()
+
+    @property
+    def storage(self):
+        return self
+
+    def from_(self, bucket):
+        return self
+
+    def remove(self, names):
+        self.removed.extend(names)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """ingest_document against an in-memory Qdrant, with fake embeddings and storage."""
+    qdrant = QdrantClient(":memory:")
+    qdrant.create_collection(COLLECTION_NAME, vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+    monkeypatch.setattr(ingestion, "qdrant", qdrant)
+    monkeypatch.setattr(vector_writer, "qdrant", qdrant)
+    monkeypatch.setattr(ingestion, "ensure_schema", lambda: None)
+
+    supabase = FakeSupabase()
+    monkeypatch.setattr(ingestion, "supabase", supabase)
+
+    # Three words per line and three tokens per chunk: every line is one chunk
+    chunker = TokenChunker(lambda texts: [len(t.split()) for t in texts], max_tokens=3)
+    monkeypatch.setattr(ingestion, "get_chunker", lambda: chunker)
+
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return np.array([[1.0, len(t), t.count("a") + 1, 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(ingestion, "embed_texts_cached", embed)
+
+    uploads = []
+
+    def upload(body, filename, content_type, chat_id):
+        uploads.append(filename)
+        return f"{STORAGE_URL}{chat_id}/{len(uploads)}_{filename}"
+
+    monkeypatch.setattr(ingestion, "upload_to_supabase_storage", upload)
+
+    pipeline = type("Pipeline", (), {})()
+    pipeline.qdrant = qdrant
+    pipeline.supabase = supabase
+    pipeline.embedded = embedded
+
+    def ingest(lines, chat_id="chat-1", progress=None):
+        data = "".join(f"{line}\n" for line in lines).encode("utf-8")
+        return ingest_document(chat_id, "doc.txt", "text/plain", UploadBuffer(data=data, size=len(data)), progress)
+
+    def points(chat_id="chat-1"):
+        records, _ = qdrant.scroll(
+            COLLECTION_NAME,
+            scroll_filter=models.Filter(
+                must=[models.FieldCondition(key="chat_id", match=models.MatchValue(value=chat_id))]
+            ),
+            limit=1000,
+        )
+        return {record.payload["text"]: record.payload for record in records}
+
+    pipeline.ingest = ingest
+    pipeline.points = points
+    return pipeline
+
+
+def lines(n):
+    return [f"line {i} words" for i in range(n)]
+
+
+def test_reupload_embeds_only_new_chunks(pipeline):
+    pipeline.ingest(lines(30))
+    first_url = pipeline.supabase.file_url
+    pipeline.embedded.clear()
+
+    edited = lines(30)
+    edited[7] = "line seven edited"
+    edited.append("appended line here")
+    del edited[20]
+    reported = {}
+    chunk_count, file_url = pipeline.ingest(edited, progress=lambda stage, **fields: reported.update(fields))
+
+    assert chunk_count == 30
+    assert pipeline.embedded == ["line seven edited", "appended line here"]
+    assert reported["chunks_embedded"] == 2 and reported["chunks_reused"] == 28
+    assert set(pipeline.points()) == set(edited)
+    # The replaced file is removed once the new version is stored
+    assert pipeline.supabase.file_url == file_url != first_url
+    assert pipeline.supabase.removed == [first_url[len(STORAGE_URL):]]
+
+
+def test_moved_chunks_get_their_positions_rewritten(pipeline):
+    pipeline.ingest(lines(3))
+    before = pipeline.points()
+    pipeline.ingest(["new first line"] + lines(3))
+    after = pipeline.points()
+
+    assert after["line 0 words"]["chunk_index"] == 1
+    assert after["line 0 words"]["char_start"] == len("new first line\n")
+    assert after["line 2 words"]["chunk_index"] == 3
+    # One document across versions, so retrieval still merges old and new neighbours
+    assert {payload["doc_id"] for payload in after.values()} == {before["line 0 words"]["doc_id"]}
+
+
+def test_failed_reupload_keeps_the_previous_version(pipeline, monkeypatch):
+    pipeline.ingest(lines(5))
+    previous = pipeline.points()
+    previous_url = pipeline.supabase.file_url
+
+    def broken_upload(*args):
+        raise RuntimeError("storage down")
+
+    monkeypatch.setattr(ingestion, "upload_to_supabase_storage", broken_upload)
+    with pytest.raises(IngestionError):
+        pipeline.ingest(lines(3) + ["brand new line"])
+
+    assert pipeline.points() == previous
+    assert pipeline.supabase.file_url == previous_url
+    assert pipeline.supabase.removed == []
+
+
+def test_legacy_random_id_points_are_replaced(pipeline):
+    legacy_ids = [str(uuid.uuid4()) for _ in range(3)]
+    pipeline.qdrant.upsert(COLLECTION_NAME, points=[
+        models.PointStruct(id=point_id, vector=[1.0] * DIM, payload={"text": f"old chunk {i}", "chat_id": "chat-1"})
+        for i, point_id in enumerate(legacy_ids)
+    ])
+
+    pipeline.ingest(lines(2))
+
+    assert set(pipeline.points()) == set(lines(2))
+    assert pipeline.qdrant.retrieve(COLLECTION_NAME, ids=legacy_ids) == []
+
+
+def test_appended_documents_get_their_own_doc_id(pipeline, monkeypatch):
+    monkeypatch.setattr(ingestion, "INCREMENTAL_REINDEX", False)
+    pipeline.ingest(["first doc line"])
+    pipeline.ingest(["second doc line"])
+
+    points = pipeline.points()
+    assert set(points) == {"first doc line", "second doc line"}
+    assert points["first doc line"]["doc_id"] != points["second doc line"]["doc_id"]
+    assert points["first doc line"]["chunk_index"] == points["second doc line"]["chunk_index"] == 0
+
+
+def test_chunker_failure_is_an_ingestion_error(pipeline, monkeypatch):
+    opened = []
+
+    class TrackedUpload(UploadBuffer):
+        def open(self):
+            opened.append(super().open())
+            return opened[-1]
+
+    def broken_chunker():
+        raise ValueError("Unknown chunker: nope")
+
+    monkeypatch.setattr(ingestion, "get_chunker", broken_chunker)
+    with pytest.raises(IngestionError) as exc:
+        ingest_document("chat-1", "doc.txt", "text/plain", TrackedUpload(data=b"some text\n"))
+
+    assert exc.value.status_code == 500
+    assert opened and all(f.closed for f in opened)
+    assert pipeline.points() == {}
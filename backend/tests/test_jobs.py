@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from app.jobs import JobStore
+
+
+def test_job_moves_through_stages():
+    store = JobStore()
+    job = store.create("chat-1", "user-1", "doc.pdf")
+    assert job["stage"] == "queued"
+
+    store.update(job["job_id"], "embedding", chunks_embedded=10)
+    store.update(job["job_id"], "completed", chunks_total=12, file_url="https://files/doc.pdf")
+
+    stored = store.get(job["job_id"])
+    assert stored["stage"] == "completed"
+    assert stored["chunks_embedded"] == 10
+    assert stored["chunks_total"] == 12
+    assert stored["updated_at"] >= stored["created_at"]
+
+
+def test_get_returns_a_copy():
+    store = JobStore()
+    job = store.create("chat-1", "user-1", "doc.pdf")
+    store.get(job["job_id"])["stage"] = "failed"
+    assert store.get(job["job_id"])["stage"] == "queued"
+
+
+def test_update_and_remove_of_unknown_job_are_ignored():
+    store = JobStore()
+    store.update("missing", "failed")
+    store.remove("missing")
+    assert store.get("missing") is None
+
+
+def test_finished_jobs_expire_after_retention():
+    store = JobStore(retention_seconds=60)
+    done = store.create("chat-1", "user-1", "a.pdf")
+    running = store.create("chat-1", "user-1", "b.pdf")
+    store.update(done["job_id"], "completed")
+    store._jobs[done["job_id"]]["updated_at"] = datetime.utcnow() - timedelta(seconds=120)
+    store._jobs[running["job_id"]]["updated_at"] = datetime.utcnow() - timedelta(seconds=120)
+
+    store.create("chat-1", "user-1", "c.pdf")  # creating prunes
+
+    assert store.get(done["job_id"]) is None
+    assert store.get(running["job_id"]) is not None  # unfinished jobs never expire
+
+
+def test_oldest_finished_jobs_go_first_when_full():
+    store = JobStore(max_jobs=3)
+    first = store.create("chat-1", "user-1", "1.pdf")
+    second = store.create("chat-1", "user-1", "2.pdf")
+    running = store.create("chat-1", "user-1", "3.pdf")
+    store.update(first["job_id"], "failed")
+    store.update(second["job_id"], "completed")
+
+    newest = store.create("chat-1", "user-1", "4.pdf")
+
+    assert store.get(first["job_id"]) is None
+    assert store.get(second["job_id"]) is not None
+    assert store.get(running["job_id"]) is not None
+    assert store.get(newest["job_id"]) is not None
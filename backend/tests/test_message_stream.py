@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import app.rag as rag
+from app.cache import answer_cache
+from app.llm import FakeStreamingLLM, set_llm
+from app.middlewares.chat_ownership import remember_chat_owner
+from app.supabase_client import get_async_supabase
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.rows = None
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    async def execute(self):
+        self.table.inserted.extend(self.rows)
+        return type("Result", (), {"data": self.rows})()
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.inserted = []
+
+    def table(self, name):
+        assert name == "messages"
+        return FakeQuery(self)
+
+
+@pytest.fixture
+def stream_api(api, monkeypatch):
+    from app.main import app
+
+    database = FakeSupabase()
+    app.dependency_overrides[get_async_supabase] = lambda: database
+    api.database = database
+
+    async def fake_prepare_prompt(query, chat_id, top_k=5):
+        return rag.PreparedPrompt(f"Question: {query}", None, None, ("chunk-1",))
+
+    monkeypatch.setattr(rag, "prepare_prompt", fake_prepare_prompt)
+    remember_chat_owner("chat-1", "user-1")
+    answer_cache.clear()
+    yield api
+    set_llm(None)
+
+
+def _events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _post(api, content="What is it?"):
+    return api.post("/api/messages/stream", json={"chat_id": "chat-1", "role": "user", "content": content})
+
+
+def test_stream_emits_tokens_then_done_and_stores_the_pair(stream_api):
+    set_llm(FakeStreamingLLM(reply="It is a test."))
+
+    events = _events(_post(stream_api))
+
+    assert [name for name, _ in events] == ["token", "token", "token", "token", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "It is a test."
+    done = events[-1][1]
+    assert done["assistant_message"]["content"] == "It is a test."
+    assert [row["role"] for row in stream_api.database.inserted] == ["user", "assistant"]
+
+
+def test_mid_stream_failure_emits_error_and_stores_nothing(stream_api):
+    set_llm(FakeStreamingLLM(reply="Partial answer", error="[RATE_LIMITED] Rate limit exceeded."))
+
+    events = _events(_post(stream_api))
+
+    assert [name for name, _ in events] == ["token", "token", "error"]
+    assert "[RATE_LIMITED]" in events[-1][1]["detail"]
+    assert all("[RATE_LIMITED]" not in data.get("text", "") for _, data in events)
+    assert stream_api.database.inserted == []
+    assert answer_cache.stats()["size"] == 0
+
+
+def test_failed_answer_is_not_served_from_cache(stream_api):
+    set_llm(FakeStreamingLLM(reply="Partial", error="[ERROR] boom"))
+    _post(stream_api, "Same question")
+
+    set_llm(FakeStreamingLLM(reply="Full answer."))
+    events = _events(_post(stream_api, "Same question"))
+
+    assert events[-1][0] == "done"
+    assert events[-1][1]["assistant_message"]["content"] == "Full answer."
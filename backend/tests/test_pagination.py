@@ -0,0 +1,118 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import PageParams, decode_cursor, encode_cursor, fetch_page
+
+
+class FakeQuery:
+    """Select builder over in-memory rows: applies order and limit, records keyset filters."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.filters = []
+        self.orders = []
+        self.limit_value = None
+
+    def or_(self, expression):
+        self.filters.append(expression)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.limit_value = n
+        return self
+
+    async def execute(self):
+        rows = self.rows
+        for column, desc in reversed(self.orders):
+            rows = sorted(rows, key=lambda row: row[column], reverse=desc)
+        if self.limit_value is not None:
+            rows = rows[:self.limit_value]
+        return type("Result", (), {"data": rows})()
+
+
+IDS = [str(uuid.UUID(int=i)) for i in range(5)]
+ROWS = [{"id": IDS[i], "created_at": f"2024-01-01T00:00:0{i}"} for i in range(5)]
+
+
+def _page(limit=None, before=None, after=None):
+    return PageParams(limit=limit, before=before, after=after)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"id": IDS[1], "created_at": "2024-01-01T00:00:00+00:00"})
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2024-01-01T00:00:00+00:00", IDS[1])
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    "bm90IGpzb24",
+    encode_cursor({"id": IDS[0], "created_at": "2024-01-01T00:00:00"})[:-3],
+    # Values that would rewrite the or= filter they are spliced into
+    encode_cursor({"id": IDS[0], "created_at": '2024-01-01",id.neq.null,created_at.gt."2000'}),
+    encode_cursor({"id": 'x"),or(id.neq.null', "created_at": "2024-01-01T00:00:00"}),
+    encode_cursor({"id": 7, "created_at": 7}),
+])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_before_and_after_together_is_a_400():
+    cursor = encode_cursor(ROWS[0])
+    with pytest.raises(HTTPException):
+        _page(before=cursor, after=cursor)
+
+
+def test_without_paging_parameters_every_row_is_returned():
+    query = FakeQuery(ROWS)
+    rows, next_cursor = asyncio.run(fetch_page(query, _page(), newest_first=False))
+
+    assert rows == ROWS
+    assert next_cursor is None
+    assert query.limit_value is None
+
+
+def test_newest_first_page_and_cursor():
+    query = FakeQuery(ROWS)
+    rows, next_cursor = asyncio.run(fetch_page(query, _page(limit=2), newest_first=True))
+
+    assert [row["id"] for row in rows] == [IDS[4], IDS[3]]
+    assert decode_cursor(next_cursor) == (ROWS[3]["created_at"], IDS[3])
+    assert query.limit_value == 3  # one extra row detects the next page
+
+
+def test_oldest_first_listing_is_fetched_newest_first_and_reversed():
+    # Messages: the latest page, shown oldest to newest
+    rows, next_cursor = asyncio.run(fetch_page(FakeQuery(ROWS), _page(limit=3), newest_first=False))
+
+    assert [row["id"] for row in rows] == [IDS[2], IDS[3], IDS[4]]
+    assert decode_cursor(next_cursor) == (ROWS[2]["created_at"], IDS[2])
+
+
+def test_before_cursor_filters_to_older_rows():
+    query = FakeQuery(ROWS[:2])  # what the database returns for the filter
+    rows, next_cursor = asyncio.run(fetch_page(query, _page(before=encode_cursor(ROWS[2])), newest_first=False))
+
+    assert query.filters == [
+        f'created_at.lt."{ROWS[2]["created_at"]}",and(created_at.eq."{ROWS[2]["created_at"]}",id.lt."{IDS[2]}")'
+    ]
+    assert [row["id"] for row in rows] == [IDS[0], IDS[1]]
+    assert next_cursor is None
+
+
+def test_after_cursor_pages_forward_oldest_first():
+    query = FakeQuery(ROWS[3:])
+    rows, next_cursor = asyncio.run(fetch_page(query, _page(limit=1, after=encode_cursor(ROWS[2])), newest_first=True))
+
+    assert query.orders == [("created_at", False), ("id", False)]
+    assert [row["id"] for row in rows] == [IDS[3]]
+    assert decode_cursor(next_cursor) == (ROWS[3]["created_at"], IDS[3])
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+import app.ingestion as ingestion
+from app.middlewares.chat_ownership import remember_chat_owner
+
+
+@pytest.fixture
+def stub_ingestion(monkeypatch):
+    calls = []
+
+    def fake_ingest(chat_id, filename, content_type, upload, progress=None):
+        with upload.open() as f:
+            calls.append((chat_id, filename, f.read()))
+        if progress:
+            progress("embedding", chunks_embedded=3)
+        return 3, f"https://files/{filename}"
+
+    monkeypatch.setattr(ingestion, "ingest_document", fake_ingest)
+    monkeypatch.setattr("app.routes.upload.ingest_document", fake_ingest)
+    remember_chat_owner("chat-1", "user-1")
+    return calls
+
+
+def _wait_for_stage(api, job_id, stages=("completed", "failed"), timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = api.get(f"/api/upload/jobs/{job_id}").json()
+        if job["stage"] in stages:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_background_upload_returns_202_and_a_pollable_job(api, stub_ingestion):
+    res = api.post(
+        "/api/upload/",
+        params={"chat_id": "chat-1", "background": "true"},
+        files={"file": ("notes.txt", b"hello world", "text/plain")},
+    )
+
+    assert res.status_code == 202
+    body = res.json()
+    assert body["status_url"] == f"/api/upload/jobs/{body['job_id']}"
+
+    job = _wait_for_stage(api, body["job_id"])
+    assert job["stage"] == "completed"
+    assert job["chunks_total"] == 3
+    assert job["file_url"] == "https://files/notes.txt"
+    assert stub_ingestion == [("chat-1", "notes.txt", b"hello world")]
+
+
+def test_job_of_another_user_is_not_found(api, stub_ingestion):
+    res = api.post(
+        "/api/upload/",
+        params={"chat_id": "chat-1", "background": "true"},
+        files={"file": ("notes.txt", b"hello", "text/plain")},
+    )
+    job_id = res.json()["job_id"]
+    _wait_for_stage(api, job_id)
+
+    api.user["user_id"] = "user-2"
+    assert api.get(f"/api/upload/jobs/{job_id}").status_code == 404
+
+
+def test_unknown_job_is_not_found(api):
+    assert api.get("/api/upload/jobs/does-not-exist").status_code == 404
+
+
+def test_failed_ingestion_is_reported_on_the_job(api, monkeypatch):
+    def failing_ingest(chat_id, filename, content_type, upload, progress=None):
+        raise ingestion.IngestionError(400, "Empty or unreadable file.")
+
+    monkeypatch.setattr(ingestion, "ingest_document", failing_ingest)
+    remember_chat_owner("chat-1", "user-1")
+
+    res = api.post(
+        "/api/upload/",
+        params={"chat_id": "chat-1", "background": "true"},
+        files={"file": ("empty.txt", b"", "text/plain")},
+    )
+    job = _wait_for_stage(api, res.json()["job_id"])
+    assert job["stage"] == "failed"
+    assert job["error"] == "Empty or unreadable file."
+
+
+def test_synchronous_upload_returns_the_result(api, stub_ingestion):
+    res = api.post(
+        "/api/upload/",
+        params={"chat_id": "chat-1"},
+        files={"file": ("notes.txt", b"hello", "text/plain")},
+    )
+    assert res.status_code == 200
+    assert res.json()["file_url"] == "https://files/notes.txt"
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_finished_ingestion_invalidates_the_chat_in_this_process(api, stub_ingestion, background):
+    from app.cache import answer_cache
+
+    answer_cache.set(("chat-1", "prompt-hash"), "stale answer")
+    res = api.post(
+        "/api/upload/",
+        params={"chat_id": "chat-1", "background": str(background).lower()},
+        files={"file": ("notes.txt", b"hello", "text/plain")},
+    )
+    if background:
+        _wait_for_stage(api, res.json()["job_id"])
+
+    assert answer_cache.get(("chat-1", "prompt-hash")) is None
@@ -0,0 +1,51 @@
+import asyncio
+import io
+import os
+
+from starlette.datastructures import UploadFile
+
+import app.uploads as uploads
+from app.uploads import UploadBuffer, spool_upload
+
+
+def _spool(data: bytes):
+    return asyncio.run(spool_upload(UploadFile(io.BytesIO(data), filename="doc.bin")))
+
+
+def test_small_upload_stays_in_memory():
+    upload = _spool(b"hello")
+    assert upload.path is None and upload.size == 5
+    with upload.open() as f:
+        assert f.read() == b"hello"
+    with upload.storage_body() as body:
+        assert body == b"hello"
+
+
+def test_large_upload_is_spooled_to_disk_and_removed_on_close(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_MEMORY_LIMIT", 4)
+    monkeypatch.setattr(uploads, "UPLOAD_READ_CHUNK", 3)
+    monkeypatch.setattr(uploads, "UPLOAD_SPOOL_DIR", str(tmp_path))
+
+    upload = _spool(b"0123456789")
+
+    assert upload.path is not None and upload.size == 10
+    with open(upload.path, "rb") as f:
+        assert f.read() == b"0123456789"
+    with upload.storage_body() as body:
+        assert body.read() == b"0123456789"
+    assert body.closed  # closed by us, not left to the storage client
+
+    path = upload.path
+    upload.close()
+    assert not os.path.exists(path)
+    upload.close()  # idempotent
+
+
+def test_buffer_survives_pickling_for_process_workers(tmp_path):
+    import pickle
+
+    path = tmp_path / "upload"
+    path.write_bytes(b"data")
+    clone = pickle.loads(pickle.dumps(UploadBuffer(path=str(path), size=4)))
+    with clone.open() as f:
+        assert f.read() == b"data"
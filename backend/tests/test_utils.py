@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from app.utils import _convert_dataframe_to_text, _iter_csv_text
+
+
+def iterrows_text(df):
+    """The row-by-row conversion the vectorized one replaced."""
+    rows = []
+    for i, row in df.iterrows():
+        sentence = ", ".join(f"{col}: {val}" for col, val in row.items())
+        rows.append(f"Row {i + 1}: {sentence}")
+    return "\n".join(rows)
+
+
+def test_numeric_columns_match_iterrows():
+    df = pd.DataFrame({"count": [1, 2, 3], "price": [2.5, np.nan, 4.0]})
+
+    assert _convert_dataframe_to_text(df) == iterrows_text(df)
+    assert _convert_dataframe_to_text(df).splitlines()[1] == "Row 2: count: 2.0, price: nan"
+
+
+def test_mixed_columns_with_missing_cells_match_iterrows():
+    df = pd.DataFrame({
+        "id": [1, 2, 3],
+        "score": [0.5, np.nan, 1.25],
+        "name": ["a", None, "c"],
+        "when": pd.to_datetime(["2024-01-01", None, "2024-03-05 12:30:00"], format="ISO8601"),
+    })
+
+    assert _convert_dataframe_to_text(df) == iterrows_text(df)
+
+
+def test_csv_with_empty_cells():
+    assert list(_iter_csv_text(io.BytesIO(b"a,b\n1,\n2,y\n"))) == ["Row 1: a: 1, b: nan\nRow 2: a: 2, b: y"]
+
+
+def test_csv_row_numbers_continue_across_reads():
+    data = b"n,label\n" + b"".join(f"{i},row {i}\n".encode() for i in range(5))
+    groups = list(_iter_csv_text(io.BytesIO(data), chunk_rows=2))
+
+    assert len(groups) == 3
+    assert "\n".join(groups) == iterrows_text(pd.read_csv(io.BytesIO(data)))
+    assert groups[1].startswith("Row 3: n: 2, label: row 2")
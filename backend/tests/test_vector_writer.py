@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import pytest
+
+import app.vector_writer as vector_writer
+from app.vector_writer import QdrantBulkWriter
+
+
+class FakeQdrant:
+    """Records upload_collection calls; `failures` makes the first N calls raise."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self.gate = threading.Event()
+        self.gate.set()
+        self._lock = threading.Lock()
+
+    def upload_collection(self, collection_name, vectors, payload, ids, batch_size, max_retries, wait):
+        self.started.release()
+        self.gate.wait(5)
+        with self._lock:
+            self.calls.append({"ids": list(ids), "wait": wait})
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("qdrant unavailable")
+
+
+@pytest.fixture
+def fake_qdrant(monkeypatch):
+    fake = FakeQdrant()
+    monkeypatch.setattr(vector_writer, "qdrant", fake)
+    monkeypatch.setattr(vector_writer.time, "sleep", lambda seconds: None)
+    return fake
+
+
+def _batch(start, size=2):
+    ids = [f"p{i}" for i in range(start, start + size)]
+    return ids, np.zeros((size, 3), dtype=np.float32), [{"i": i} for i in range(start, start + size)]
+
+
+def test_only_the_last_batch_waits(fake_qdrant):
+    writer = QdrantBulkWriter("docs", parallel=1)
+    for start in (0, 2, 4):
+        writer.write(*_batch(start))
+    writer.close()
+
+    assert [call["wait"] for call in fake_qdrant.calls] == [False, False, True]
+    assert fake_qdrant.calls[-1]["ids"] == ["p4", "p5"]
+    assert writer.points_written == 6
+
+
+def test_failed_batch_is_retried_on_its_own(fake_qdrant):
+    fake_qdrant.failures = 2
+    writer = QdrantBulkWriter("docs", parallel=1, max_retries=3)
+    writer.write(*_batch(0))
+    writer.write(*_batch(2))
+    writer.close()
+
+    assert [call["ids"] for call in fake_qdrant.calls] == [["p0", "p1"]] * 3 + [["p2", "p3"]]
+    assert writer.points_written == 4
+
+
+def test_exhausted_retries_surface_on_close(fake_qdrant):
+    fake_qdrant.failures = 3
+    writer = QdrantBulkWriter("docs", parallel=1, max_retries=3)
+    writer.write(*_batch(0))
+    writer.write(*_batch(2))
+
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_abort_drops_queued_batches(fake_qdrant):
+    fake_qdrant.gate.clear()
+    writer = QdrantBulkWriter("docs", parallel=2)
+    for start in (0, 2, 4, 6):
+        writer.write(*_batch(start))
+
+    # p0 and p2 are uploading, p4 is queued behind them and p6 is held back
+    assert fake_qdrant.started.acquire(timeout=5) and fake_qdrant.started.acquire(timeout=5)
+    threading.Timer(0.1, fake_qdrant.gate.set).start()
+    writer.abort()
+
+    # abort() returned only after the in-flight uploads finished
+    assert sorted(call["ids"][0] for call in fake_qdrant.calls) == ["p0", "p2"]
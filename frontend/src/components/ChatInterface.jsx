@@ -100,14 +100,21 @@ const ChatInterface = ({ chat, onFileUploaded }) => {
 
     try {
       // Call backend which stores user msg, generates assistant msg, returns both
-      const response = await apiClient.post("/messages", {
-        chat_id: activeChatId,
-        role: "user",
-        content: userMessageText,
-      });
+      const response = await apiClient.post(
+        "/messages",
+        {
+          chat_id: activeChatId,
+          role: "user",
+          content: userMessageText,
+        },
+        { params: { include_history: false } }
+      );
 
-      // Response is full updated list for this chat
-      setMessages(response.data || []);
+      // Response is just the new user/assistant pair; swap it in for the optimistic message
+      setMessages((prev) => [
+        ...prev.filter((msg) => msg.id !== optimisticUserMessage.id),
+        ...(response.data || []),
+      ]);
     } catch (error) {
       console.error("Failed to send message:", error);
     } finally {